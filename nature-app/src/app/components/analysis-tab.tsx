@@ -1,24 +1,27 @@
 "use client";
 import { useEffect, useState } from 'react';
 import { useAPI } from '../hooks/use-api';
+import { AnalysisMask } from '../lib/mask';
 
-interface AnalysisResult {
-  results_id: number;
-  user_id: number;
-  location_id: number;
-  analysis_date: string;
-  analysis_type: string;
-  request_params: {
-    analysis_type: string;
-    start_date: string;
-    end_date: string;
-    bbox: number[];
-    requested_at: string;
-  };
+// Listing item returned by GET /results (ResultSummary in the backend)
+interface ResultSummary {
+  result_id: number;
   status: string;
+  analysis_type: string;
+  analysis_date: string;
   requested_at: string;
   completed_at: string | null;
   error_message: string | null;
+  polygon_count: number;
+  changed_area: number;
+  bbox: number[] | null;
+}
+
+// Result returned by GET /results/{result_id}, including the stored analysis output
+interface ResultDetail {
+  result_id: number;
+  status: string;
+  error_message: string | null;
   result: AnalysisResultData | null;
 }
 
@@ -29,7 +32,7 @@ interface AnalysisPolygon {
 }
 
 interface AnalysisResultData {
-  mask: number[][];
+  mask: AnalysisMask;
   polygons: AnalysisPolygon[];
   mask_shape: number[];
 }
@@ -46,7 +49,7 @@ export default function AnalysisTab({ isVisible, onClose, polygonBbox, onApplyRe
   const [analysisType, setAnalysisType] = useState<'orthophoto' | 'satellite'>('orthophoto');
   const [startDate, setStartDate] = useState('');
   const [endDate, setEndDate] = useState('');
-  const [results, setResults] = useState<AnalysisResult[]>([]);
+  const [results, setResults] = useState<ResultSummary[]>([]);
   const [isLoading, setIsLoading] = useState(false);
 
   useEffect(() => {
@@ -57,7 +60,7 @@ export default function AnalysisTab({ isVisible, onClose, polygonBbox, onApplyRe
 
   const fetchResults = async () => {
     try {
-      const data = await apiClient.get('/results') as AnalysisResult[];
+      const data = await apiClient.get('/results') as ResultSummary[];
       setResults(data.slice(0, 10)); // Show max 10 most recent results
     } catch (error) {
       console.error('Error fetching results:', error);
@@ -98,7 +101,7 @@ export default function AnalysisTab({ isVisible, onClose, polygonBbox, onApplyRe
   const handleApplyLayer = async (resultId: string) => {
     try {
       // Fetch the specific result details
-      const resultData = await apiClient.get(`/results/${resultId}`) as AnalysisResult;
+      const resultData = await apiClient.get(`/results/${resultId}`) as ResultDetail;
       
       if (resultData.result && resultData.result.polygons) {
         // Apply the polygons to the map
@@ -203,7 +206,7 @@ export default function AnalysisTab({ isVisible, onClose, polygonBbox, onApplyRe
             ) : (
               results.map((result) => (
                 <div
-                  key={result.results_id}
+                  key={result.result_id}
                   className="border border-gray-200 rounded-lg p-3"
                 >
                   <div className="flex justify-between items-start mb-2">
@@ -226,7 +229,7 @@ export default function AnalysisTab({ isVisible, onClose, polygonBbox, onApplyRe
                     </div>
                     {result.status === 'complete' && (
                       <button
-                        onClick={() => handleApplyLayer(result.results_id.toString())}
+                        onClick={() => handleApplyLayer(result.result_id.toString())}
                         className="text-sm bg-gray-100 hover:bg-gray-200 px-2 py-1 rounded"
                       >
                         Apply Layer
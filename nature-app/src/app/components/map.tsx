@@ -16,6 +16,7 @@ import proj4 from 'proj4';
 import { useEffect, useState, useRef, useMemo } from "react";
 import AnalysisTab from './analysis-tab';
 import ResultsViewer from './results-viewer';
+import { AnalysisMask } from '../lib/mask';
 
 interface AnalysisPolygon {
     type: string;
@@ -24,7 +25,7 @@ interface AnalysisPolygon {
 }
 
 interface AnalysisResult {
-    mask: number[][];
+    mask: AnalysisMask;
     polygons: AnalysisPolygon[];
     mask_shape: number[];
 }
@@ -1,24 +1,27 @@
 "use client";
 import { useEffect, useState } from 'react';
 import { useAPI } from '../hooks/use-api';
+import { AnalysisMask } from '../lib/mask';
 
-interface DatabaseAnalysisResult {
+// Listing item returned by GET /results (ResultSummary in the backend)
+interface ResultSummary {
   result_id: number;
-  user_id: number;
-  location_id: number;
-  analysis_date: string;
-  analysis_type: string;
-  request_params: {
-    analysis_type: string;
-    start_date: string;
-    end_date: string;
-    bbox: number[];
-    requested_at: string;
-  };
   status: string;
+  analysis_type: string;
+  analysis_date: string;
   requested_at: string;
   completed_at: string | null;
   error_message: string | null;
+  polygon_count: number;
+  changed_area: number;
+  bbox: number[] | null;
+}
+
+// Result returned by GET /results/{result_id}, including the stored analysis output
+interface ResultDetail {
+  result_id: number;
+  status: string;
+  error_message: string | null;
   result: AnalysisResult | null;
 }
 
@@ -29,7 +32,7 @@ interface AnalysisPolygon {
 }
 
 interface AnalysisResult {
-  mask: number[][];
+  mask: AnalysisMask;
   polygons: AnalysisPolygon[];
   mask_shape: number[];
 }
@@ -42,7 +45,7 @@ interface ResultsViewerProps {
 
 export default function ResultsViewer({ isVisible, onClose, onApplyResult }: ResultsViewerProps) {
   const { apiClient } = useAPI();
-  const [results, setResults] = useState<DatabaseAnalysisResult[]>([]);
+  const [results, setResults] = useState<ResultSummary[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const [currentPage, setCurrentPage] = useState(0);
   const [hasMore, setHasMore] = useState(true);
@@ -59,8 +62,10 @@ export default function ResultsViewer({ isVisible, onClose, onApplyResult }: Res
   const fetchResults = async (page: number = 0, append: boolean = false) => {
     setIsLoading(true);
     try {
-      const offset = page * resultsPerPage;
-      const data = await apiClient.get(`/results?offset=${offset}&limit=${resultsPerPage}`) as DatabaseAnalysisResult[];
+      // Keyset pagination: continue after the oldest result already shown
+      const lastResult = append && page > 0 ? results[results.length - 1] : undefined;
+      const cursor = lastResult ? `&before_id=${lastResult.result_id}` : '';
+      const data = await apiClient.get(`/results?limit=${resultsPerPage}${cursor}`) as ResultSummary[];
       
       if (append && page > 0) {
         setResults(prev => [...prev, ...data]);
@@ -81,7 +86,7 @@ export default function ResultsViewer({ isVisible, onClose, onApplyResult }: Res
   const handleApplyLayer = async (resultId: string) => {
     try {
       // Fetch the specific result details
-      const resultData = await apiClient.get(`/results/${resultId}`) as DatabaseAnalysisResult;
+      const resultData = await apiClient.get(`/results/${resultId}`) as ResultDetail;
       
       if (resultData.result && resultData.result.polygons) {
         // Apply the polygons to the map
@@ -0,0 +1,10 @@
+// Change masks are stored by the backend as uncompressed COCO RLE: alternating run lengths of
+// unchanged (0) and changed (1) pixels in column-major order, starting with unchanged.
+export interface RleMask {
+  encoding: 'coco_rle';
+  size: number[]; // [height, width]
+  counts: number[];
+}
+
+// Older results store the mask as nested lists of rows
+export type AnalysisMask = RleMask | number[][];
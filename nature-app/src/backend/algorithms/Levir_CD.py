@@ -1,4 +1,3 @@
-import math
 import os
 import random
 
@@ -8,6 +7,8 @@ from skimage import exposure, io
 from torch.utils import data
 from torchvision.transforms import functional as F
 
+from .utils.crop_plan import CropPlan
+
 num_classes = 1
 MEAN = np.array([123.675, 116.28, 103.53])
 STD  = np.array([58.395, 57.12, 57.375])
@@ -40,7 +41,6 @@ def sliding_crop_CD(imgs1, imgs2, labels, size):
     crop_imgs1 = []
     crop_imgs2 = []
     crop_labels = []
-    label_dims = len(labels[0].shape)
     for img1, img2, label in zip(imgs1, imgs2, labels):
         h = img1.shape[0]
         w = img1.shape[1]
@@ -52,32 +52,10 @@ def sliding_crop_CD(imgs1, imgs2, labels, size):
             crop_imgs2.append(img2)
             crop_labels.append(label)
             continue
-        h_rate = h/c_h
-        w_rate = w/c_w
-        h_times = math.ceil(h_rate)
-        w_times = math.ceil(w_rate)
-        if h_times==1: stride_h=0
-        else:
-            stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))            
-        if w_times==1: stride_w=0
-        else:
-            stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-        for j in range(h_times):
-            for i in range(w_times):
-                s_h = int(j*c_h - j*stride_h)
-                if(j==(h_times-1)): s_h = h - c_h
-                e_h = s_h + c_h
-                s_w = int(i*c_w - i*stride_w)
-                if(i==(w_times-1)): s_w = w - c_w
-                e_w = s_w + c_w
-                # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-                # print('%d %d %d %d'%(s_h_s, e_h_s, s_w_s, e_w_s))
-                crop_imgs1.append(img1[s_h:e_h, s_w:e_w, :])
-                crop_imgs2.append(img2[s_h:e_h, s_w:e_w, :])
-                if label_dims==2:
-                    crop_labels.append(label[s_h:e_h, s_w:e_w])
-                else:
-                    crop_labels.append(label[s_h:e_h, s_w:e_w, :])
+        for rows, cols in CropPlan(h, w, size).slices():
+            crop_imgs1.append(img1[rows, cols, :])
+            crop_imgs2.append(img2[rows, cols, :])
+            crop_labels.append(label[rows, cols])
 
     print('Sliding crop finished. %d pairs of images created.' %len(crop_imgs1))
     return crop_imgs1, crop_imgs2, crop_labels
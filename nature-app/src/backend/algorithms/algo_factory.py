@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from algorithms.ortho_analysis import OrthoAnalysis
+from algorithms.model_registry import model_registry
 from algorithms.satellite_analysis import SatelitteAnalysis
 from exceptions import InvalidAlgorithmException
 
@@ -18,7 +18,8 @@ class ConcreteAlgorithmFactory(AbstractAlgorithmFactory):
     def create_algorithm(self, type: str):
         match type:
             case "orthophoto":
-                return OrthoAnalysis(device="cpu")
+                # Models are shared across requests instead of being reloaded per analysis
+                return model_registry.get_ortho_analysis()
             case "satelitte":
                 return SatelitteAnalysis()
             case _:
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from algorithms.ortho_analysis import OrthoAnalysis
+
+# Load environment variables
+load_dotenv()
+
+MODEL_DEVICE = os.getenv("MODEL_DEVICE", "cpu")
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() == "true"
+# FastSAM encoder input size in pixels. Empty encodes every crop at its own (stride aligned) size
+ENCODER_IMGSZ = int(os.getenv("ENCODER_IMGSZ", "") or 0) or None
+# Side in pixels of the windows the encoder runs over in one pass. Empty encodes every crop separately
+ENCODER_WINDOW = int(os.getenv("ENCODER_WINDOW", "") or 0) or None
+if ENCODER_IMGSZ and ENCODER_WINDOW:
+    # Window features are sliced per crop, which needs every crop encoded at its own size
+    raise ValueError("ENCODER_IMGSZ and ENCODER_WINDOW cannot be set together, set one of them")
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of loaded analysis models.
+
+    Each (model, device, checkpoint) combination is loaded once, either at startup
+    through `preload` or lazily on first use, and the same instance is shared by
+    every request afterwards.
+    """
+    def __init__(self):
+        self._models = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def get_ortho_analysis(self, device: str = MODEL_DEVICE, checkpoint_path: Optional[str] = None,
+                           encoder_imgsz: Optional[int] = ENCODER_IMGSZ) -> OrthoAnalysis:
+        """Returns the shared OrthoAnalysis instance for the device, checkpoint and encoder size, loading it if needed."""
+        # A None checkpoint is resolved by OrthoAnalysis once, on the cold load
+        key = ("orthophoto", device, checkpoint_path or "auto", encoder_imgsz)
+
+        start = time.perf_counter()
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                # Another request may have loaded the model while we waited for the lock
+                model = self._models.get(key)
+                if model is None:
+                    model = OrthoAnalysis(model_checkpoint_path=checkpoint_path, device=device, encoder_imgsz=encoder_imgsz)
+                    self._models[key] = model
+                    self._record_timing(key, "cold", time.perf_counter() - start)
+                    print(f"Loaded {key[0]} model on {device} in {self._timings[key]['cold_load_s']:.2f}s")
+                    return model
+        self._record_timing(key, "warm", time.perf_counter() - start)
+        return model
+
+    def preload(self, device: str = MODEL_DEVICE):
+        """Loads the default models up front so the first request does not pay the load cost."""
+        self.get_ortho_analysis(device=device)
+
+    def get_load_timings(self) -> dict:
+        """Returns cold and warm load timings per registered model."""
+        with self._lock:
+            return {
+                f"{name}:{device}:{os.path.basename(checkpoint)}:{encoder_imgsz or 'crop'}": dict(timing)
+                for (name, device, checkpoint, encoder_imgsz), timing in self._timings.items()
+            }
+
+    def _record_timing(self, key: tuple, kind: str, elapsed: float):
+        timing = self._timings.setdefault(key, {"cold_load_s": None, "warm_hits": 0, "last_warm_s": None})
+        if kind == "cold":
+            timing["cold_load_s"] = elapsed
+        else:
+            timing["warm_hits"] += 1
+            timing["last_warm_s"] = elapsed
+
+
+# Shared by every request handled by this process
+model_registry = ModelRegistry()
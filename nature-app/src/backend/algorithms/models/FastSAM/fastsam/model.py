@@ -44,11 +44,40 @@ class FastSAM(YOLO):
         overrides['mode'] = kwargs.get('mode', 'predict')
         assert overrides['mode'] in ['track', 'predict']
         overrides['save'] = kwargs.get('save', False)  # do not save by default if called in Python
-        self.predictor = FastSAMPredictor(overrides=overrides)
-        self.predictor.setup_model(model=self.model, verbose=False)
+        # Reuse the predictor (and its backend/warmup state) while the overrides stay the same
+        if self.predictor is None or getattr(self.predictor, 'overrides', None) != overrides:
+            self.predictor = FastSAMPredictor(overrides=overrides)
+            self.predictor.overrides = overrides
+            self.predictor.setup_model(model=self.model, verbose=False)
 
         return self.predictor(source, stream=stream)
 
+    def features(self, im, model=None):
+        """
+        Run only the backbone and neck and return the multi-scale feature maps.
+
+        The layers are run in order like `BaseModel._predict_once`, but the loop stops before the
+        Segment head, so no box/class branches, mask protos, NMS or mask decoding are computed.
+        The returned tensors are the inputs of the head (its `f` layers, e.g. [P3, P4, P5, layer1]),
+        which is what the head passes through as its feature output.
+
+        Args:
+            im (torch.Tensor): Preprocessed (N, 3, H, W) batch on the model device and dtype.
+            model (nn.Module): The (possibly fused) model to run. Defaults to `self.model`.
+
+        Returns:
+            (List[torch.Tensor]): The feature maps in the head's input order.
+        """
+        model = model if model is not None else self.model
+        *layers, head = model.model
+        y, x = [], im
+        for m in layers:
+            if m.f != -1:  # if not from previous layer
+                x = y[m.f] if isinstance(m.f, int) else [x if j == -1 else y[j] for j in m.f]  # from earlier layers
+            x = m(x)  # run
+            y.append(x if m.i in model.save else None)  # save output
+        return [x if j == -1 else y[j] for j in head.f]
+
     def train(self, **kwargs):
         """Function trains models but raises an error as FastSAM models do not support training."""
         raise NotImplementedError("FastSAM models don't support training")
@@ -3,7 +3,12 @@ from torch import nn
 from torch.nn import functional as F
 
 from ..utils.misc import initialize_weights
-from .FastSAM.fastsam import FastSAM
+from .FastSAM.fastsam import FastSAM, FastSAMPredictor
+
+# Output stride of the deepest FastSAM feature map; encoder inputs must be a multiple of it
+ENCODER_STRIDE = 32
+# Output stride of each encoder feature map, in the order run_encoder returns them ([P3, P4, P5, layer1])
+FEATURE_STRIDES = (8, 16, 32, 4)
 
 # Patch ultralytics torch_safe_load to use weights_only=False
 try:
@@ -101,9 +106,10 @@ class SAM_CD(nn.Module):
         device: str='cuda',
         conf: float=0.4,
         iou: float=0.9,
-        imgsz: int=1024,
+        imgsz: int=None,
         retina_masks: bool=True,
         done_warmup: bool=True,
+        shared_pass: bool=True,
         ):
         super(SAM_CD, self).__init__()
         self.model = FastSAM(model_name)
@@ -113,7 +119,13 @@ class SAM_CD(nn.Module):
         self.conf = conf
         self.iou = iou
         self.image = None
-        self.image_feats = None        
+        self.image_feats = None
+        self.predictor = None
+        self.shared_pass = shared_pass
+        # Encoder input size. None encodes every crop at its own size (padded to a multiple of the
+        # stride), an int resizes every crop to imgsz x imgsz first (e.g. 1024 to upscale 512 crops)
+        if imgsz is not None and imgsz % ENCODER_STRIDE:
+            raise ValueError(f"imgsz must be a multiple of {ENCODER_STRIDE}, got {imgsz}")
          
         self.Adapter32 = nn.Sequential(nn.Conv2d(640, 160, kernel_size=1, stride=1, padding=0, bias=False),
                                        nn.BatchNorm2d(160), nn.ReLU())
@@ -139,17 +151,65 @@ class SAM_CD(nn.Module):
         initialize_weights(self.Adapter32, self.Adapter16, self.Adapter8, self.Adapter4, self.Dec2, self.Dec1, self.Dec0,\
                            self.segmenter, self.resCD, self.headC, self.segmenterC)
 
-    def run_encoder(self, image):
-        self.image = image
-        feats = self.model(
-            self.image,
+    def setup_encoder(self):
+        """
+        Builds the FastSAM predictor once and keeps it for every later encoder call.
+        The predictor owns the fused backend model, device selection and warmup state.
+        """
+        if self.predictor is not None:
+            return self.predictor
+        overrides = dict(
+            task='segment',
+            mode='predict',
+            save=False,
+            verbose=False,
             device=self.device,
             retina_masks=self.retina_masks,
-            imgsz=self.imgsz,
+            imgsz=self.imgsz or 1024,
             conf=self.conf,
-            iou=self.iou
-            )
-        return feats
+            iou=self.iou,
+        )
+        warmup_size = self.imgsz or 512
+        predictor = FastSAMPredictor(overrides=overrides)
+        predictor.setup_model(model=self.model.model, verbose=False)
+        predictor.model.warmup(imgsz=(1, 3, warmup_size, warmup_size))
+        self.predictor = predictor
+        return predictor
+
+    def run_encoder(self, image):
+        """
+        Runs a batched (N, 3, H, W) tensor through the FastSAM backbone and returns the
+        multi-scale feature maps, without the per-call predictor construction, source
+        loading and result post-processing of `FastSAM.predict`.
+        Only the backbone and neck are run; the Segment head (boxes, mask protos) is skipped.
+        """
+        self.image = image
+        predictor = self.setup_encoder()
+        im = image.to(predictor.device)
+        im = im.half() if predictor.model.fp16 else im.float()
+        # predictor.model is the AutoBackend; its .model is the fused network it runs
+        return self.model.features(im, model=predictor.model.model)
+
+    def _encoder_input(self, x: torch.Tensor) -> torch.Tensor:
+        """Resizes the input to imgsz if one is set, otherwise pads it (bottom/right) to a multiple of the stride."""
+        h, w = x.shape[-2:]
+        if self.imgsz is not None:
+            if (h, w) != (self.imgsz, self.imgsz):
+                x = F.interpolate(x, (self.imgsz, self.imgsz), mode="bilinear", align_corners=False)
+            return x
+        pad_h, pad_w = -h % ENCODER_STRIDE, -w % ENCODER_STRIDE
+        if pad_h or pad_w:
+            x = F.pad(x, (0, pad_w, 0, pad_h), mode="replicate")
+        return x
+
+    def upsample_to_input(self, out: torch.Tensor, input_shape) -> torch.Tensor:
+        """Upsamples a low resolution output to the input size, dropping any stride padding added by `_encoder_input`."""
+        if self.imgsz is not None:
+            return F.interpolate(out, input_shape, mode="bilinear", align_corners=True)
+        h, w = input_shape
+        encoder_shape = (h + -h % ENCODER_STRIDE, w + -w % ENCODER_STRIDE)
+        out = F.interpolate(out, encoder_shape, mode="bilinear", align_corners=True)
+        return out[..., :h, :w]
 
     def _make_layer(self, block, inplanes, planes, blocks, stride=1):
         downsample = None
@@ -166,38 +226,92 @@ class SAM_CD(nn.Module):
 
         return nn.Sequential(*layers)
 
-    def forward(self, x1: torch.Tensor, x2: torch.Tensor):
-    
-        input_shape = x1.shape[-2:]
-        featsA = self.run_encoder(x1)
-        featsB = self.run_encoder(x2)
-        
-        featA_s4 = self.Adapter4(featsA[3].clone())
-        featA_s8 = self.Adapter8(featsA[0].clone())
-        featA_s16 = self.Adapter16(featsA[1].clone())
-        featA_s32 = self.Adapter32(featsA[2].clone())
-        
-        decA_2 = self.Dec2(featA_s32, featA_s16)
-        decA_1 = self.Dec1(decA_2, featA_s8)
-        decA_0 = self.Dec0(decA_1, featA_s4)
-        outA = self.segmenter(decA_0)
-        
-        featB_s4 = self.Adapter4(featsB[3].clone())
-        featB_s8 = self.Adapter8(featsB[0].clone())
-        featB_s16 = self.Adapter16(featsB[1].clone())
-        featB_s32 = self.Adapter32(featsB[2].clone())              
-        
-        decB_2 = self.Dec2(featB_s32, featB_s16)
-        decB_1 = self.Dec1(decB_2, featB_s8)
-        decB_0 = self.Dec0(decB_1, featB_s4)
-        outB = self.segmenter(decB_0)
+    def _decode(self, feats, clone: bool = True):
+        """
+        Runs the adapters and the shared decoder over one set of encoder features.
+        The features are cloned for training, so autograd never holds on to the frozen encoder's outputs.
+        """
+        if clone:
+            feats = [feat.clone() for feat in feats]
+        feat_s4 = self.Adapter4(feats[3])
+        feat_s8 = self.Adapter8(feats[0])
+        feat_s16 = self.Adapter16(feats[1])
+        feat_s32 = self.Adapter32(feats[2])
+
+        dec_2 = self.Dec2(feat_s32, feat_s16)
+        dec_1 = self.Dec1(dec_2, feat_s8)
+        dec_0 = self.Dec0(dec_1, feat_s4)
+        out = self.segmenter(dec_0)
+        return dec_0, out
+
+    def _forward_low_res(self, x1: torch.Tensor, x2: torch.Tensor, clone: bool = True):
+        """Returns the change, A and B logits at the decoder resolution (1/4 of the encoder input)."""
+        x1, x2 = self._encoder_input(x1), self._encoder_input(x2)
+        if self.shared_pass and not self.training:
+            # A and B share all weights up to the change head, so push them through as one batch and split.
+            # Only done in eval mode, where BatchNorm uses running stats and each sample is independent.
+            feats = self.run_encoder(torch.cat([x1, x2], dim=0))
+            dec_0, out = self._decode(feats, clone)
+            decA_0, decB_0 = dec_0.chunk(2, dim=0)
+            outA, outB = out.chunk(2, dim=0)
+        else:
+            featsA = self.run_encoder(x1)
+            featsB = self.run_encoder(x2)
+            decA_0, outA = self._decode(featsA, clone)
+            decB_0, outB = self._decode(featsB, clone)
              
+        outC = self._change_head(decA_0, decB_0, outA, outB)
+        return outC, outA, outB
+
+    def _change_head(self, decA_0, decB_0, outA, outB):
         A = self.SA(torch.cat([outA, outB], dim=1))  
         featC = torch.cat([decA_0, decB_0], 1)
         featC = self.resCD(featC)
         featC = self.headC(featC) * A
-        outC = self.segmenterC(featC)
+        return self.segmenterC(featC)
+
+    def encode(self, x: torch.Tensor):
+        """
+        Encodes a batch of images once, e.g. a large window whose features are then decoded tile by tile.
+        Returns the multi-scale features in run_encoder order; see `slice_features` and `decode_change`.
+        """
+        return self.run_encoder(self._encoder_input(x))
+
+    @staticmethod
+    def slice_features(feats, row: int, col: int, height: int, width: int):
+        """
+        Cuts the features of the pixel window [row:row + height, col:col + width] out of a larger encoding.
+        Offsets and sizes must be multiples of ENCODER_STRIDE so every scale is cut at the same place.
+        """
+        return [feat[..., row // stride:(row + height) // stride, col // stride:(col + width) // stride]
+                for feat, stride in zip(feats, FEATURE_STRIDES)]
+
+    def decode_change(self, featsA, featsB) -> torch.Tensor:
+        """Returns the change logits at the decoder resolution for (sliced) encoder features of A and B."""
+        if self.shared_pass and not self.training:
+            dec_0, out = self._decode([torch.cat([a, b], dim=0) for a, b in zip(featsA, featsB)], clone=False)
+            decA_0, decB_0 = dec_0.chunk(2, dim=0)
+            outA, outB = out.chunk(2, dim=0)
+        else:
+            decA_0, outA = self._decode(featsA, self.training)
+            decB_0, outB = self._decode(featsB, self.training)
+        return self._change_head(decA_0, decB_0, outA, outB)
+
+    def forward(self, x1: torch.Tensor, x2: torch.Tensor):
+    
+        input_shape = x1.shape[-2:]
+        outC, outA, outB = self._forward_low_res(x1, x2)
         
-        return F.interpolate(outC, input_shape, mode="bilinear", align_corners=True),\
-               F.interpolate(outA, input_shape, mode="bilinear", align_corners=True),\
-               F.interpolate(outB, input_shape, mode="bilinear", align_corners=True)
+        return self.upsample_to_input(outC, input_shape),\
+               self.upsample_to_input(outA, input_shape),\
+               self.upsample_to_input(outB, input_shape)
+
+    def forward_change(self, x1: torch.Tensor, x2: torch.Tensor, low_res: bool = False) -> torch.Tensor:
+        """
+        Inference-only forward that returns just the change logits.
+        Skips the feature clones and the upsampling of the A/B segmentation outputs, which only training uses.
+        With low_res the logits stay at the decoder resolution, so callers can average or threshold first
+        and bring the result to the input size once with `upsample_to_input`.
+        """
+        outC, _, _ = self._forward_low_res(x1, x2, clone=False)
+        return outC if low_res else self.upsample_to_input(outC, x1.shape[-2:])
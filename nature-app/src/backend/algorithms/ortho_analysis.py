@@ -1,15 +1,18 @@
 import glob
-import math
+import hashlib
 import os
 from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
 
 import numpy as np
 import pyproj
+import rasterio
+import shapely
 import torch
+from rasterio import features
 from rasterio.transform import Affine
-from shapely.geometry import Polygon
-from shapely.ops import transform
+from rasterio.windows import Window
 from skimage import measure
 from torch.nn import functional as F
 from torchvision.transforms import functional as transF
@@ -17,7 +20,10 @@ from torchvision.transforms import functional as transF
 from . import Levir_CD as Data  # Assuming Data.normalize_image
 
 # Assuming these are available (or you provide dummy implementations for illustration)
+from .models.SAM_CD import ENCODER_STRIDE
 from .models.SAM_CD import SAM_CD as Net
+from .utils.crop_plan import CropPlan
+from .utils.utils import coco_rle_to_mask, mask_to_coco_rle
 
 
 def find_sam_cd_checkpoint() -> str:
@@ -52,8 +58,36 @@ def find_sam_cd_checkpoint() -> str:
     )
 
 
+# Rough peak activation memory of one A/B crop pair through SAM_CD, per input pixel
+BYTES_PER_PIXEL_PAIR = 1024
+
+# Flip dims run for each test time augmentation policy. "flips-only" covers the two mirror flips,
+# "4-way" adds the combined flip (a 180 degree rotation).
+TTA_POLICIES = {
+    "none": [()],
+    "2-way": [(), (3,)],
+    "flips-only": [(), (2,), (3,)],
+    "4-way": [(), (2,), (3,), (2, 3)],
+}
+
+
+# Lower bound of the stitching weights, so pixels only covered by a patch edge still count
+BLEND_WEIGHT_FLOOR = 1e-2
+
+
+@lru_cache(maxsize=8)
+def _blend_weights(height: int, width: int) -> np.ndarray:
+    """Separable sine squared (Hann) window for a patch, 1 in the centre and BLEND_WEIGHT_FLOOR at the edges."""
+    rows = np.sin(np.pi * (np.arange(height) + 0.5) / height) ** 2
+    cols = np.sin(np.pi * (np.arange(width) + 0.5) / width) ** 2
+    weights = np.maximum(np.outer(rows, cols), BLEND_WEIGHT_FLOOR).astype(np.float32)
+    weights.flags.writeable = False
+    return weights
+
+
 class OrthoAnalysis:
-    def __init__(self, model_checkpoint_path: Optional[str] = None, device: str = 'cuda', default_crop_size: tuple = (1024, 1024), default_tta: bool = True):
+    def __init__(self, model_checkpoint_path: Optional[str] = None, device: str = 'cuda', default_crop_size: tuple = (1024, 1024), default_tta: bool = True,
+                 default_max_batch_size: int = 8, memory_budget_mb: int = 2048, encoder_imgsz: Optional[int] = None):
         """
         Initializes the Change Detection Service.
         Loads the model once.
@@ -63,8 +97,12 @@ class OrthoAnalysis:
             device: Device to run the model on ('cuda' or 'cpu')
             default_crop_size: Default crop size for processing large images
             default_tta: Whether to use test time augmentation by default
+            default_max_batch_size: Maximum number of crop pairs run through the network at once
+            memory_budget_mb: Memory budget used to cap the batch size for large crops
+            encoder_imgsz: Size every crop is resized to before the FastSAM encoder. None encodes crops at their own size
         """
         self.device = torch.device(device) if device == 'cpu' else torch.device(device, int(0))
+        self.encoder_imgsz = encoder_imgsz
         
         # Auto-find checkpoint if not provided
         if model_checkpoint_path is None:
@@ -72,14 +110,18 @@ class OrthoAnalysis:
             print(f"Auto-found checkpoint: {model_checkpoint_path}")
         
         self.net = self._load_model(model_checkpoint_path)
+        # Identifies the encoder weights and input size in feature cache keys
+        self.encoder_version = self._encoder_fingerprint(self.net)
         self.default_crop_size = default_crop_size
         self.default_tta = default_tta
+        self.default_max_batch_size = default_max_batch_size
+        self.memory_budget_mb = memory_budget_mb
         print(f"ChangeDetectionService initialized. Model loaded on {self.device}.")
 
     def _load_model(self, chkpt_path: str):
         """Loads the PyTorch model from the checkpoint path."""
         device_str = 'cpu' if self.device.type == 'cpu' else str(self.device)
-        net = Net(device=device_str)
+        net = Net(device=device_str, imgsz=self.encoder_imgsz)
         state_dict = torch.load(chkpt_path, map_location="cpu", weights_only=False)
         new_state_dict = OrderedDict()
         for k, v in state_dict.items():
@@ -91,124 +133,104 @@ class OrthoAnalysis:
         net.to(self.device).eval() # Set to evaluation mode
         return net
 
-    def _create_crops(self, img_np: np.ndarray, crop_size: tuple):
+    @staticmethod
+    def _encoder_fingerprint(net) -> str:
+        """Hash of the frozen FastSAM weights and the encoder input size, so cached features never outlive either."""
+        digest = hashlib.sha256(str(net.imgsz).encode())
+        for name, tensor in net.model.model.state_dict().items():
+            digest.update(name.encode())
+            digest.update(tensor.detach().cpu().numpy().tobytes())
+        return digest.hexdigest()[:16]
+
+    def _batch_size_for(self, crop_size: tuple, max_batch_size: int, n_views: int = 1) -> int:
         """
-        Creates overlapping crops from a large image.
-        Returns a list of numpy arrays for crops.
+        Returns how many crop pairs fit in one batch without exceeding the memory budget.
+        Each crop pair is expanded into n_views augmented copies inside the forward pass.
         """
-        img_crops = []
-        h, w = img_np.shape[0], img_np.shape[1]
-        c_h, c_w = crop_size
+        if self.encoder_imgsz is not None:
+            crop_size = (self.encoder_imgsz, self.encoder_imgsz) # Activations scale with the encoder input, not the crop
+        pair_bytes = crop_size[0] * crop_size[1] * BYTES_PER_PIXEL_PAIR
+        budget_batch = (self.memory_budget_mb * 1024 * 1024) // pair_bytes
+        return int(max(1, min(max_batch_size, budget_batch) // n_views))
 
-        if h < c_h or w < c_w:
-            # Handle cases where image is smaller than crop_size (e.g., pad or resize)
-            # For simplicity, returning original image as a single "crop" here, but real-world needs padding.
-            print(f"Warning: Image ({h},{w}) smaller than crop_size {crop_size}. Returning as single crop.")
-            return [img_np] # Or raise an error, or pad and then return
-            
-        rows = math.ceil(h / c_h)
-        cols = math.ceil(w / c_w)
-        
-        # Calculate stride for overlapping crops
-        stride_h = int((c_h * rows - h) / (rows - 1)) if rows > 1 else 0
-        stride_w = int((c_w * cols - w) / (cols - 1)) if cols > 1 else 0
-
-        for j in range(rows):
-            for i in range(cols):
-                s_h = int(j * c_h - j * stride_h)
-                if j == (rows - 1) and s_h + c_h > h: s_h = h - c_h # Ensure last crop fits
-                s_h = max(0, s_h) # Ensure start_h is not negative
-
-                e_h = s_h + c_h
-
-                s_w = int(i * c_w - i * stride_w)
-                if i == (cols - 1) and s_w + c_w > w: s_w = w - c_w # Ensure last crop fits
-                s_w = max(0, s_w) # Ensure start_w is not negative
-
-                e_w = s_w + c_w
-                
-                img_crops.append(img_np[s_h:e_h, s_w:e_w, :])
-        # print(f'Sliding crop finished. {len(img_crops)} images created.')
-        return img_crops
-
-    def _stitch_pred(self, patch_list: list, original_size: tuple) -> np.ndarray:
+    def _window_size_for(self, crop_size: tuple, window_size: int, halo: int) -> int:
         """
-        Stitches predicted patches back into a full-sized prediction map.
-        Assumes patches are binary (0 or 1).
+        Caps the encoder window so one A/B pass over it (halo included) fits the memory budget, like
+        `_batch_size_for` caps crop batches. Never smaller than one crop.
         """
-        H, W = original_size
-        if not patch_list:
-            return np.zeros(original_size, dtype=np.uint8) # Return empty mask if no patches
-
-        h_patch, w_patch = patch_list[0].shape
-        
-        # Calculate stitch rows/cols and overlap based on original image size and patch size
-        stitch_rows = math.ceil(H / h_patch)
-        stitch_cols = math.ceil(W / w_patch)
-        
-        # Recalculate stride based on actual stitch dimensions for precise overlap
-        h_overlap = 0 if stitch_rows <= 1 else int((h_patch * stitch_rows - H) / (stitch_rows - 1))
-        w_overlap = 0 if stitch_cols <= 1 else int((w_patch * stitch_cols - W) / (stitch_cols - 1))
-        
-        # Initialize an empty array for the stitched image (float to handle averages if needed)
-        stitched_img = np.zeros(original_size, dtype=np.float32)
-        overlap_counts = np.zeros(original_size, dtype=np.float32) # To handle averaging overlaps
-
-        # Iterate through patches and place them, handling overlaps
-        for r in range(stitch_rows):
-            for c in range(stitch_cols):
-                idx = r * stitch_cols + c
-                if idx >= len(patch_list): # Safety check
-                    continue
-
-                patch = patch_list[idx]
-                
-                # Calculate start and end coordinates for placing the patch in the stitched image
-                s_h = r * (h_patch - h_overlap)
-                s_w = c * (w_patch - w_overlap)
-                e_h = s_h + h_patch
-                e_w = s_w + w_patch
-
-                # Adjust for boundary conditions if the last row/col exceeds original size
-                if e_h > H: s_h = H - h_patch
-                if e_w > W: s_w = W - w_patch
-                
-                # Add patch data and increment overlap counts
-                stitched_img[s_h:e_h, s_w:e_w] += patch
-                overlap_counts[s_h:e_h, s_w:e_w] += 1
-
-        # Average overlapping regions to finalize the stitched image
-        # Avoid division by zero where overlap_counts is 0
-        overlap_counts[overlap_counts == 0] = 1 # Set 0s to 1 to prevent /0 errors, their values will be 0 anyway
-        stitched_img = (stitched_img / overlap_counts)
-        
-        # Convert to binary mask using a threshold (e.g., > 0.5 for averaged probabilities)
-        # Assuming original patches were boolean, averaging multiple True's will give > 0.5
-        stitched_img = (stitched_img > 0.5).astype(np.uint8) * 255 # Convert to 0 or 255
-        
-        # print(f'Pred Stitched ({stitched_img.shape[0]}, {stitched_img.shape[1]})')
-        return stitched_img
+        budget_pixels = (self.memory_budget_mb * 1024 * 1024) // BYTES_PER_PIXEL_PAIR
+        budget_size = int(budget_pixels ** 0.5) - 2 * halo
+        capped = max(max(crop_size), min(window_size, budget_size))
+        if capped < window_size:
+            print(f"Encoder window {window_size}px exceeds the {self.memory_budget_mb}MB budget, using {capped}px")
+        return capped
+
+    def _resolve_tta_policy(self, use_tta: Optional[bool], tta_policy: Optional[str]) -> str:
+        """Picks the TTA policy from an explicit policy name, falling back to the use_tta flag."""
+        if tta_policy is not None:
+            if tta_policy not in TTA_POLICIES:
+                raise ValueError(f"Unknown TTA policy '{tta_policy}'. Expected one of {list(TTA_POLICIES)}")
+            return tta_policy
+        use_tta = use_tta if use_tta is not None else self.default_tta
+        return "4-way" if use_tta else "none"
 
+    def _to_batch(self, crops: list) -> torch.Tensor:
+        """Stacks HWC numpy crops into a single (N, 3, H, W) float tensor on the model device."""
+        batch = torch.from_numpy(np.stack(crops)).permute(0, 3, 1, 2)
+        return batch.to(self.device).float()
 
-    def predict_change(self, imgA_bytes: bytes, imgB_bytes: bytes, crop_size: tuple = None, use_tta: bool = None, 
-                      return_polygons: bool = False, bbox: list = None) -> tuple:
+    def _stitch_pred(self, patches: np.ndarray, offsets: list, canvas: np.ndarray):
+        """
+        Accumulates a batch of predicted probability patches into the canvas, in place.
+
+        Each patch adds weight * (probability - 0.5) at its crop offset, with a blending window
+        that is largest in the patch centre and falls off towards the edges, where predictions
+        are least reliable. A pixel is changed when the weighted average probability of all
+        patches covering it is above 0.5, i.e. when its accumulated value is above 0, so
+        a single canvas is enough and the threshold is applied once after the last batch.
+        The patches are overwritten, so no temporary arrays are allocated per patch.
+        """
+        for patch, (s_h, s_w) in zip(patches, offsets):
+            h_patch, w_patch = patch.shape
+            weights = _blend_weights(h_patch, w_patch)
+            view = canvas[s_h:s_h + h_patch, s_w:s_w + w_patch]
+            np.subtract(patch, 0.5, out=patch)
+            np.multiply(patch, weights, out=patch)
+            view += patch
+
+    def predict_change(self, imgA_bytes: np.ndarray, imgB_bytes: np.ndarray, crop_size: tuple = None, use_tta: bool = None, 
+                      return_polygons: bool = False, bbox: list = None, max_batch_size: int = None,
+                      tta_policy: str = None, polygon_engine: str = "contours", encoder_window: int = None,
+                      layers: tuple = None, feature_cache=None, persist_layers: tuple = ()) -> tuple:
         """
-        Performs change detection prediction on two input images (as bytes).
+        Performs change detection prediction on two input images.
 
         Args:
-            imgA_bytes: Bytes data of the first image (e.g., from a web request).
-            imgB_bytes: Bytes data of the second image.
+            imgA_bytes: The first image as a decoded RGB uint8 array (HxWx3), e.g. straight from the image download service.
+            imgB_bytes: The second image, same shape as the first.
             crop_size: Tuple (height, width) for model input cropping. Uses default if None.
             use_tta: Boolean for Test Time Augmentation. Uses default if None.
             return_polygons: Boolean to also return shapely polygons. Uses default if None.
             bbox: Bounding box as [min_lat, min_lon, max_lat, max_lon] in EPSG:25832. Required if return_polygons is True.
+            max_batch_size: Maximum number of crop pairs per forward pass. Uses default if None.
+            tta_policy: One of TTA_POLICIES ('none', '2-way', 'flips-only', '4-way'). Overrides use_tta if given.
+            polygon_engine: 'contours' (skimage find_contours) or 'shapes' (rasterio.features.shapes, keeps holes).
+            encoder_window: If set, the encoder runs once per window of up to this many pixels (capped by the memory
+                            budget) instead of once per crop, see `_predict_shared_encoder`.
+            layers: Names of the layers (e.g. 'geodanmark_2024_12_5cm') the two images were downloaded from.
+            feature_cache: Cache (services.feature_cache.FeatureCache) for the encoder features of each window. Used
+                           with encoder_window when layers and bbox are given, so an image compared again (e.g. the
+                           same year against another one) is not encoded again.
+            persist_layers: Layers whose features are also written to the cache's disk tier, i.e. the ones
+                            later comparisons are expected to reuse. Other features are only kept in memory.
 
         Returns:
             If return_polygons is False: A numpy array representing the binary change mask (0 or 255).
             If return_polygons is True: A tuple (mask, polygons) where polygons is a list of shapely Polygon objects in EPSG:25832.
         """
         crop_size = crop_size if crop_size is not None else self.default_crop_size
-        use_tta = use_tta if use_tta is not None else self.default_tta
+        tta_policy = self._resolve_tta_policy(use_tta, tta_policy)
+        max_batch_size = max_batch_size if max_batch_size is not None else self.default_max_batch_size
 
         imgA = Data.normalize_image(imgA_bytes)
         imgB = Data.normalize_image(imgB_bytes)
@@ -216,35 +238,38 @@ class OrthoAnalysis:
         original_h, original_w = imgA.shape[:2]
 
         with torch.no_grad():
-            if imgA.shape[0]>crop_size[0] or imgA.shape[1]>crop_size[1]:
+            if encoder_window is not None and (imgA.shape[0]>crop_size[0] or imgA.shape[1]>crop_size[1]):
+                # --- Encode large windows once, decode per crop ---
+                cache = feature_cache if layers is not None and bbox is not None else None
+                final_pred_mask = self._predict_shared_encoder(imgA, imgB, crop_size, encoder_window, tta_policy, max_batch_size,
+                                                               layers, bbox, cache, persist_layers)
+
+            elif imgA.shape[0]>crop_size[0] or imgA.shape[1]>crop_size[1]:
                 # --- Process with Cropping and Stitching ---
-                imgA_crops = self._create_crops(imgA, crop_size)
-                imgB_crops = self._create_crops(imgB, crop_size) # Assuming same cropping for B
-
-                if not imgA_crops or not imgB_crops:
-                    raise ValueError("Image cropping failed or resulted in empty crops.")
-
-                preds = []
-                for idx in range(len(imgA_crops)): # Assume A and B have same num crops
-                    cropA_np = imgA_crops[idx]
-                    cropB_np = imgB_crops[idx]
-
-                    # Convert numpy arrays to PyTorch tensors
-                    tensorA = transF.to_tensor(cropA_np).unsqueeze(0).to(self.device).float()
-                    tensorB = transF.to_tensor(cropB_np).unsqueeze(0).to(self.device).float()
-                    output = self._run_inference_with_tta(self.net, tensorA, tensorB, use_tta)
-                    
-                    pred = output.cpu().detach().numpy().squeeze() > 0.5
-                    preds.append(pred)
+                # One plan for both images and the stitcher; an image smaller than the crop along one axis is padded
+                plan = CropPlan(original_h, original_w, crop_size, pad=True)
+                imgA = plan.pad_image(imgA)
+                imgB = plan.pad_image(imgB) # Assuming same cropping for B
+
+                # Run the crops through the network in batches instead of one at a time
+                batch_size = self._batch_size_for(crop_size, max_batch_size, len(TTA_POLICIES[tta_policy]))
+                # Soft predictions are blended into one half precision canvas as each batch comes out
+                canvas = np.zeros(plan.padded_shape, dtype=np.float16)
+                for start in range(0, len(plan), batch_size):
+                    tensorA = self._to_batch(list(plan.crops(imgA, start, start + batch_size)))
+                    tensorB = self._to_batch(list(plan.crops(imgB, start, start + batch_size)))
+                    output = self._run_inference_with_tta(self.net, tensorA, tensorB, tta_policy)
+
+                    self._stitch_pred(output.cpu().detach().numpy()[:, 0], plan.offsets[start:start + batch_size], canvas)
                 
-                final_pred_mask = self._stitch_pred(preds, (original_h, original_w))
+                final_pred_mask = (canvas[:original_h, :original_w] > 0).astype(np.uint8) * np.uint8(255)
 
             else:
                 # --- Process Full Image (No Cropping) ---
                 tensorA = transF.to_tensor(imgA).unsqueeze(0).to(self.device).float()
                 tensorB = transF.to_tensor(imgB).unsqueeze(0).to(self.device).float()
                 
-                output = self._run_inference_with_tta(self.net, tensorA, tensorB, use_tta)
+                output = self._run_inference_with_tta(self.net, tensorA, tensorB, tta_policy)
                 
                 # Convert to binary mask (0 or 255)
                 final_pred_mask = ((output.cpu().detach().numpy().squeeze() > 0.5) * 255).astype(np.uint8)
@@ -252,76 +277,290 @@ class OrthoAnalysis:
         if return_polygons:
             if bbox is None:
                 raise ValueError("bbox parameter is required when return_polygons=True")
-            polygons = self._mask_to_polygons(final_pred_mask, bbox)
-            return self._serialize_result(final_pred_mask, polygons)
+            polygons = self._mask_to_polygons(final_pred_mask, bbox, engine=polygon_engine)
+            return self._serialize_result(final_pred_mask, polygons, bbox)
         else:
-            return self._serialize_result(final_pred_mask, [])
+            return self._serialize_result(final_pred_mask, [], bbox)
 
-    def _serialize_result(self, mask: np.ndarray, polygons: list) -> dict:
+    def _predict_shared_encoder(self, imgA: np.ndarray, imgB: np.ndarray, crop_size: tuple, window_size: int,
+                                tta_policy: str, max_batch_size: int, layers: tuple = None, bbox: list = None,
+                                feature_cache=None, persist_layers: tuple = ()) -> np.ndarray:
+        """
+        Crop based prediction where the encoder runs once per large window instead of once per crop.
+
+        The image is split into windows of window_size pixels (capped by `_window_size_for`), each read with
+        a halo of a quarter crop so crops at the window edge still see their surroundings. The whole window
+        of A and B is encoded in one pass, the features of every crop are sliced out of that encoding (crop offsets are aligned to
+        the encoder stride) and only the decoder and change head run per crop. Crop predictions are
+        blended as in `_stitch_pred` and each window only keeps its core, so windows never overlap.
+        With a feature_cache, the features of each window are looked up by layer and window bounds (from
+        bbox) and only encoded on a miss. Returns the binary change mask (0 or 255).
+        """
+        if self.net.imgsz is not None:
+            raise ValueError("encoder_window needs crops encoded at their own size (encoder_imgsz=None)")
+        if crop_size[0] % ENCODER_STRIDE or crop_size[1] % ENCODER_STRIDE:
+            raise ValueError(f"encoder_window needs a crop size that is a multiple of {ENCODER_STRIDE}, got {crop_size}")
+        height, width = imgA.shape[:2]
+        halo = min(crop_size) // 4
+        window_size = self._window_size_for(crop_size, window_size, halo)
+        batch_size = self._batch_size_for(crop_size, max_batch_size)
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        for row in range(0, height, window_size):
+            for col in range(0, width, window_size):
+                core_h, core_w = min(window_size, height - row), min(window_size, width - col)
+                r0, c0 = max(0, row - halo), max(0, col - halo)
+                r1, c1 = min(height, row + core_h + halo), min(width, col + core_w + halo)
+                tiles = None
+                if feature_cache is not None:
+                    # Map coordinates of the window, from the bbox ([minX, minY, maxX, maxY]) over the whole image
+                    x_res, y_res = (bbox[2] - bbox[0]) / width, (bbox[3] - bbox[1]) / height
+                    bounds = [bbox[0] + c0 * x_res, bbox[3] - r1 * y_res, bbox[0] + c1 * x_res, bbox[3] - r0 * y_res]
+                    tiles = [(layer, bounds, layer in persist_layers) for layer in layers]
+                canvas = self._predict_window(imgA[r0:r1, c0:c1], imgB[r0:r1, c0:c1], crop_size, tta_policy, batch_size,
+                                              tiles, feature_cache)
+                core = canvas[row - r0:row - r0 + core_h, col - c0:col - c0 + core_w]
+                mask[row:row + core_h, col:col + core_w] = (core > 0).astype(np.uint8) * np.uint8(255)
+        return mask
+
+    def _predict_window(self, windowA: np.ndarray, windowB: np.ndarray, crop_size: tuple, tta_policy: str,
+                        batch_size: int, tiles: list = None, feature_cache=None) -> np.ndarray:
+        """
+        Encodes one window of A and B once per TTA view and decodes it crop by crop.
+        tiles holds the (layer, bounds, persist) of the window in A and B for the feature cache.
+        Returns the blended canvas of the window (see `_stitch_pred`, > 0 is change).
+        """
+        window_h, window_w = windowA.shape[:2]
+        plan = CropPlan(window_h, window_w, crop_size, pad=True, align=ENCODER_STRIDE)
+        tensorA = self._to_batch([plan.pad_image(windowA)])
+        tensorB = self._to_batch([plan.pad_image(windowB)])
+
+        canvas = np.zeros(plan.padded_shape, dtype=np.float32)
+        for dims in TTA_POLICIES[tta_policy]:
+            viewA = torch.flip(tensorA, dims) if dims else tensorA
+            viewB = torch.flip(tensorB, dims) if dims else tensorB
+            keys = None
+            if tiles:
+                keys = [feature_cache.make_key(layer, bounds, (window_h, window_w), plan.padded_shape, self.encoder_version, dims)
+                        for layer, bounds, _ in tiles]
+            featsA, featsB = self._encode_views([viewA, viewB], keys, feature_cache, [persist for _, _, persist in tiles or ()])
+
+            # The crop grid is laid over the flipped window and the view canvas is flipped back at the end
+            view_canvas = np.zeros(plan.padded_shape, dtype=np.float32)
+            for start in range(0, len(plan), batch_size):
+                offsets = plan.offsets[start:start + batch_size]
+                cropsA = [self.net.slice_features(featsA, s_h, s_w, *crop_size) for s_h, s_w in offsets]
+                cropsB = [self.net.slice_features(featsB, s_h, s_w, *crop_size) for s_h, s_w in offsets]
+                logits = self.net.decode_change([torch.cat(scale) for scale in zip(*cropsA)],
+                                                [torch.cat(scale) for scale in zip(*cropsB)])
+                output = self.net.upsample_to_input(F.sigmoid(logits), crop_size)
+                self._stitch_pred(output.cpu().numpy()[:, 0], offsets, view_canvas)
+            canvas += np.flip(view_canvas, tuple(dim - 2 for dim in dims)) if dims else view_canvas
+
+        return canvas[:window_h, :window_w]
+
+    def _encode_views(self, views: list, keys: list = None, feature_cache=None, persist: list = None) -> list:
+        """
+        Returns the encoder features of each (1, 3, H, W) view. Views whose key is in the feature cache are
+        not encoded; the others are encoded together (one batch with a shared pass) and stored in the cache,
+        on disk too where persist is set.
+        """
+        feats = [feature_cache.get(key, self.device) for key in keys] if keys else [None] * len(views)
+        missing = [i for i, feat in enumerate(feats) if feat is None]
+        if not missing:
+            return feats
+        if self.net.shared_pass:
+            encoded = self.net.encode(torch.cat([views[i] for i in missing], dim=0))
+            encoded = [[feat[j:j + 1] for feat in encoded] for j in range(len(missing))]
+        else:
+            encoded = [self.net.encode(views[i]) for i in missing]
+        for i, view_feats in zip(missing, encoded):
+            if keys:
+                # The cache stores float16, so round fresh features the same way and a result does not
+                # depend on whether its features were encoded now or came from the cache
+                view_feats = [feat.half().to(feat.dtype) for feat in view_feats]
+                feature_cache.put(keys[i], view_feats, persist=bool(persist and persist[i]))
+            feats[i] = view_feats
+        return feats
+
+    def predict_change_windowed(self, imgA_path: str, imgB_path: str, output_path: str, crop_size: tuple = None,
+                                margin: int = None, use_tta: bool = None, max_batch_size: int = None,
+                                tta_policy: str = None) -> str:
+        """
+        Performs change detection on two co-registered rasters (e.g. GeoTIFF mosaics) window by window.
+        Crops are read from disk with rasterio, run through the network in batches and the prediction is
+        written into a tiled uint8 GeoTIFF (0 or 255) as it is produced, so peak memory depends on the
+        crop and batch size rather than on the size of the area.
+
+        Neighbouring crops overlap by 2 * margin pixels. Only the core of each prediction (the crop minus
+        the margin on every side) is written, so every output pixel comes from exactly one crop and is
+        never close to a crop edge. Crops along the raster border are padded with zeros.
+
+        Args:
+            imgA_path: Path to the first (earlier) RGB raster.
+            imgB_path: Path to the second raster, same size and grid as the first.
+            output_path: Where the change mask GeoTIFF is written. Georeferencing is copied from image A.
+            crop_size: Tuple (height, width) of the model input. Uses default if None.
+            margin: Pixels discarded at each crop edge. Defaults to 1/8 of the crop size.
+            use_tta: Boolean for Test Time Augmentation. Uses default if None.
+            max_batch_size: Maximum number of crop pairs per forward pass. Uses default if None.
+            tta_policy: One of TTA_POLICIES. Overrides use_tta if given.
+
+        Returns:
+            The output path.
+        """
+        crop_size = crop_size if crop_size is not None else self.default_crop_size
+        tta_policy = self._resolve_tta_policy(use_tta, tta_policy)
+        max_batch_size = max_batch_size if max_batch_size is not None else self.default_max_batch_size
+        c_h, c_w = crop_size
+        margin = margin if margin is not None else min(c_h, c_w) // 8
+        if 2 * margin >= min(c_h, c_w):
+            raise ValueError(f"margin {margin} leaves no core in a {crop_size} crop")
+        batch_size = self._batch_size_for(crop_size, max_batch_size, len(TTA_POLICIES[tta_policy]))
+
+        with rasterio.open(imgA_path) as srcA, rasterio.open(imgB_path) as srcB:
+            if (srcA.height, srcA.width) != (srcB.height, srcB.width):
+                raise ValueError(f"Rasters differ in size: {srcA.width}x{srcA.height} and {srcB.width}x{srcB.height}")
+            profile = {
+                'driver': 'GTiff',
+                'height': srcA.height,
+                'width': srcA.width,
+                'count': 1,
+                'dtype': rasterio.uint8,
+                'crs': srcA.crs,
+                'transform': srcA.transform,
+                'tiled': True,
+                'blockxsize': 512,
+                'blockysize': 512,
+                'compress': 'deflate',
+            }
+            with rasterio.open(output_path, 'w', **profile) as dst, torch.no_grad():
+                batch = []
+                for read_window, core_window in self._iter_windows(srcA.height, srcA.width, crop_size, margin):
+                    batch.append((self._read_crop(srcA, read_window), self._read_crop(srcB, read_window), core_window))
+                    if len(batch) == batch_size:
+                        self._predict_windows(batch, dst, margin, tta_policy)
+                        batch = []
+                if batch:
+                    self._predict_windows(batch, dst, margin, tta_policy)
+        return output_path
+
+    @staticmethod
+    def _iter_windows(height: int, width: int, crop_size: tuple, margin: int):
+        """Yields (read_window, core_window) pairs that tile the raster with cores of crop_size - 2 * margin."""
+        c_h, c_w = crop_size
+        core_h, core_w = c_h - 2 * margin, c_w - 2 * margin
+        for row in range(0, height, core_h):
+            for col in range(0, width, core_w):
+                read_window = Window(col - margin, row - margin, c_w, c_h)
+                core_window = Window(col, row, min(core_w, width - col), min(core_h, height - row))
+                yield read_window, core_window
+
+    @staticmethod
+    def _read_crop(src, window: Window) -> np.ndarray:
+        """Reads the first three bands in the window as a normalized HWC crop, zero padded outside the raster."""
+        row_off, col_off, height, width = int(window.row_off), int(window.col_off), int(window.height), int(window.width)
+        # Read only the part inside the raster and pad it here (boundless reads go through a slow VRT)
+        r0, c0 = max(0, row_off), max(0, col_off)
+        r1, c1 = min(src.height, row_off + height), min(src.width, col_off + width)
+        crop = src.read(indexes=[1, 2, 3], window=Window(c0, r0, c1 - c0, r1 - r0))
+        crop = np.pad(crop, ((0, 0), (r0 - row_off, row_off + height - r1), (c0 - col_off, col_off + width - c1)))
+        return Data.normalize_image(crop.transpose(1, 2, 0))
+
+    def _predict_windows(self, batch: list, dst, margin: int, tta_policy: str):
+        """Runs one batch of crop pairs and writes the core of each prediction to the output raster."""
+        tensorA = self._to_batch([cropA for cropA, _, _ in batch])
+        tensorB = self._to_batch([cropB for _, cropB, _ in batch])
+        output = self._run_inference_with_tta(self.net, tensorA, tensorB, tta_policy)
+        preds = output.cpu().numpy()[:, 0] > 0.5
+        for pred, (_, _, core_window) in zip(preds, batch):
+            core = pred[margin:margin + core_window.height, margin:margin + core_window.width]
+            dst.write(core.astype(np.uint8) * np.uint8(255), 1, window=core_window)
+
+    def _serialize_result(self, mask: np.ndarray, polygons: list, bbox: list = None) -> dict:
         """
         Converts numpy array and shapely polygons to JSON-serializable format.
         
         Args:
             mask: Binary mask as numpy array
             polygons: List of shapely Polygon objects
+            bbox: Bounding box the mask covers, stored so listings can show it without the mask
             
         Returns:
-            Dictionary with JSON-serializable data
+            Dictionary with JSON-serializable data. The mask is stored as an uncompressed
+            COCO RLE ({"encoding": "coco_rle", "size": [h, w], "counts": [...]}), see `deserialize_mask`.
         """
-        # Convert numpy array to list
-        mask_list = mask.tolist()
+        # Run-length encode the mask instead of storing every pixel as a nested list
+        mask_rle = mask_to_coco_rle(mask)
+        mask_rle["encoding"] = "coco_rle"
         
         # Convert shapely polygons to GeoJSON-like format
         polygon_data = []
         for polygon in polygons:
             if hasattr(polygon, 'exterior'):
-                coords = list(polygon.exterior.coords)
+                # GeoJSON rings: the exterior first, followed by any holes
+                rings = [list(polygon.exterior.coords)] + [list(interior.coords) for interior in polygon.interiors]
                 polygon_data.append({
                     "type": "Polygon",
-                    "coordinates": [coords],
+                    "coordinates": rings,
                     "area": polygon.area
                 })
         
         return {
-            "mask": mask_list,
+            "mask": mask_rle,
             "polygons": polygon_data,
-            "mask_shape": mask.shape
+            "mask_shape": list(mask.shape),
+            "bbox": list(bbox) if bbox is not None else None
         }
 
-    def _run_inference_with_tta(self, net, tensorA, tensorB, use_tta: bool) -> torch.Tensor:
+    @staticmethod
+    def deserialize_mask(mask_data) -> np.ndarray:
         """
-        Helper to run inference potentially with Test Time Augmentation.
-        Returns raw output tensor (before final thresholding).
+        Decodes a stored result mask back into a binary mask (0 or 255).
+        Handles both the RLE format and the nested lists stored by older results.
         """
-        output, _, _ = net(tensorA, tensorB)
-        output = F.sigmoid(output) # Initial sigmoid
-        
-        if use_tta:
-            # Vertical flip
-            output_v, _, _ = net(torch.flip(tensorA, [2]), torch.flip(tensorB, [2]))
-            output += F.sigmoid(torch.flip(output_v, [2]))
-            
-            # Horizontal flip
-            output_h, _, _ = net(torch.flip(tensorA, [3]), torch.flip(tensorB, [3]))
-            output += F.sigmoid(torch.flip(output_h, [3]))
-            
-            # Both flips
-            output_hv, _, _ = net(torch.flip(tensorA, [2,3]), torch.flip(tensorB, [2,3]))
-            output += F.sigmoid(torch.flip(output_hv, [2,3]))
-            
-            output = output / 4.0 # Average the augmented results
+        if isinstance(mask_data, dict) and mask_data.get("encoding") == "coco_rle":
+            return coco_rle_to_mask(mask_data) * np.uint8(255)
+        return np.asarray(mask_data, dtype=np.uint8)
 
-        return output
-
-    def _mask_to_polygons(self, mask: np.ndarray, bbox: list, source_crs: str = "EPSG:25832", min_area: int = 10) -> list:
+    def _run_inference_with_tta(self, net, tensorA, tensorB, tta_policy: str) -> torch.Tensor:
+        """
+        Helper to run inference potentially with Test Time Augmentation.
+        All flipped variants of the batch are run in a single forward pass, then un-flipped and averaged.
+        Only the change logits are computed, at the decoder resolution, and the averaged probabilities
+        are upsampled to the input size once instead of once per view.
+        Returns the averaged change probabilities (after sigmoid, before final thresholding).
+        """
+        flips = TTA_POLICIES[tta_policy]
+        batch_size = tensorA.shape[0]
+
+        batchA = torch.cat([torch.flip(tensorA, dims) if dims else tensorA for dims in flips])
+        batchB = torch.cat([torch.flip(tensorB, dims) if dims else tensorB for dims in flips])
+        # Flips commute with the encoder resize and the (align_corners) upsampling, so views can be un-flipped
+        # at low resolution. Not with stride padding, which lands on the other side of a flipped view.
+        low_res = net.imgsz is not None or all(size % ENCODER_STRIDE == 0 for size in tensorA.shape[-2:])
+        output = net.forward_change(batchA, batchB, low_res=low_res)
+        output = F.sigmoid(output)
+
+        views = output.split(batch_size)
+        output = torch.stack([torch.flip(view, dims) if dims else view for view, dims in zip(views, flips)])
+        output = output.mean(dim=0) # Average the augmented results
+        return net.upsample_to_input(output, tensorA.shape[-2:]) if low_res else output
+
+    def _mask_to_polygons(self, mask: np.ndarray, bbox: list, source_crs: str = "EPSG:25832", min_area: int = 10,
+                          simplify_tolerance: float = 0.0, engine: str = "contours") -> list:
         """
         Converts a binary mask to a list of shapely polygons in EPSG:25832.
+        All polygons are transformed, simplified and filtered in bulk with NumPy and shapely 2.x.
         
         Args:
             mask: Binary mask array (0s and 1s or 0s and 255s)
             bbox: Bounding box as [min_lat, min_lon, max_lat, max_lon] in EPSG:25832
             source_crs: Source coordinate reference system (default: EPSG:25832)
             min_area: Minimum area threshold for polygons in square meters
+            simplify_tolerance: If > 0, simplifies polygons (topology preserving) with this tolerance in meters
+            engine: 'contours' traces sub-pixel outlines with skimage (no holes), 'shapes' polygonizes
+                    connected pixel regions with rasterio.features.shapes, producing polygons with holes
             
         Returns:
             List of shapely Polygon objects in EPSG:25832
@@ -329,9 +568,6 @@ class OrthoAnalysis:
         # Ensure mask is binary (0 and 1)
         binary_mask = (mask > 0).astype(np.uint8)
         
-        # Find contours using skimage
-        contours = measure.find_contours(binary_mask, 0.5)
-        
         # Get mask dimensions
         height, width = mask.shape
         
@@ -339,40 +575,64 @@ class OrthoAnalysis:
         # bbox format from OpenLayers: [minX, minY, maxX, maxY] in EPSG:25832
         min_x, min_y, max_x, max_y = bbox[0], bbox[1], bbox[2], bbox[3]
         transform_matrix = Affine.from_gdal(min_x, (max_x - min_x) / width, 0, max_y, 0, (min_y - max_y) / height)
+
+        if engine == "contours":
+            polygons = self._polygons_from_contours(binary_mask, transform_matrix)
+        elif engine == "shapes":
+            polygons = self._polygons_from_shapes(binary_mask, transform_matrix)
+        else:
+            raise ValueError(f"Unknown polygon engine '{engine}'. Expected 'contours' or 'shapes'")
+        if len(polygons) == 0:
+            return []
         
         # Set up coordinate transformation (only if source_crs is different from EPSG:25832)
-        transformer = None
         if source_crs != "EPSG:25832":
             source_proj = pyproj.CRS(source_crs)
             target_proj = pyproj.CRS("EPSG:25832")
             transformer = pyproj.Transformer.from_crs(source_proj, target_proj, always_xy=True)
-        
-        polygons = []
-        for contour in contours:
-            # Convert contour to polygon coordinates (swap x,y to match shapely convention)
-            coords = [(point[1], point[0]) for point in contour]
-            
-            # Create polygon if it has enough points
-            if len(coords) >= 3:
-                try:
-                    # Transform pixel coordinates to geographic coordinates using the affine transform
-                    geo_coords = []
-                    for x, y in coords:
-                        geo_x, geo_y = transform_matrix * (x, y)
-                        geo_coords.append((geo_x, geo_y))
-                    
-                    # Create polygon in source CRS
-                    polygon = Polygon(geo_coords)
-                    
-                    # Transform to EPSG:25832 if needed
-                    if transformer is not None:
-                        polygon = transform(transformer.transform, polygon)
-                    
-                    # Filter by minimum area and validity
-                    if polygon.area >= min_area and polygon.is_valid:
-                        polygons.append(polygon)
-                except Exception:
-                    # Skip invalid polygons
-                    continue
-                    
-        return polygons
\ No newline at end of file
+            polygons = shapely.transform(polygons, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+        if simplify_tolerance > 0:
+            polygons = shapely.simplify(polygons, simplify_tolerance, preserve_topology=True)
+
+        # Filter by minimum area and validity
+        keep = (shapely.area(polygons) >= min_area) & shapely.is_valid(polygons)
+        return polygons[keep].tolist()
+
+    def _polygons_from_contours(self, binary_mask: np.ndarray, transform_matrix: Affine) -> np.ndarray:
+        """Traces mask outlines with skimage find_contours and builds one polygon per contour."""
+        contours = measure.find_contours(binary_mask, 0.5)
+
+        # A ring needs at least three distinct points (find_contours repeats the first point on closed contours)
+        contours = [contour for contour in contours
+                    if len(contour) - int((contour[0] == contour[-1]).all()) >= 3]
+        if not contours:
+            return np.array([], dtype=object)
+
+        # Transform all contour points at once (contours are (row, col), so col is x and row is y)
+        points = np.concatenate(contours)
+        cols, rows = points[:, 1], points[:, 0]
+        geo_x = transform_matrix.a * cols + transform_matrix.b * rows + transform_matrix.c
+        geo_y = transform_matrix.d * cols + transform_matrix.e * rows + transform_matrix.f
+
+        # Build every ring and polygon in one call each, using the contour index of each point
+        ring_indices = np.repeat(np.arange(len(contours)), [len(contour) for contour in contours])
+        rings = shapely.linearrings(np.column_stack([geo_x, geo_y]), indices=ring_indices)
+        return shapely.polygons(rings)
+
+    def _polygons_from_shapes(self, binary_mask: np.ndarray, transform_matrix: Affine) -> np.ndarray:
+        """
+        Polygonizes 4-connected regions of changed pixels with rasterio (GDAL polygonize), which labels the
+        connected components and traces their outer and inner boundaries in a single C-level pass.
+        """
+        geometries = [geometry["coordinates"] for geometry, _ in
+                      features.shapes(binary_mask, mask=binary_mask.astype(bool), connectivity=4, transform=transform_matrix)]
+        if not geometries:
+            return np.array([], dtype=object)
+
+        # Flatten to one coordinate array; the first ring of every geometry is its shell, the rest are holes
+        rings = [ring for geometry in geometries for ring in geometry]
+        coords = np.array([point for ring in rings for point in ring], dtype=np.float64)
+        ring_indices = np.repeat(np.arange(len(rings)), [len(ring) for ring in rings])
+        polygon_indices = np.repeat(np.arange(len(geometries)), [len(geometry) for geometry in geometries])
+        return shapely.polygons(shapely.linearrings(coords, indices=ring_indices), indices=polygon_indices)
@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+
+
+class CropPlan:
+    """
+    Layout of overlapping sliding-window crops over an image of a given size.
+
+    The crop offsets are computed once and shared by everything that works on the
+    same grid: cropping the inputs, and stitching the predictions back together.
+    Crops are produced lazily as views into the image, so no copies are made.
+
+    Along each axis the image is covered by ceil(length / crop) crops, evenly
+    overlapping, with the last crop aligned to the image edge. With pad=True an
+    image smaller than the crop is padded at the bottom/right to the crop size
+    (see `pad_image`); otherwise the single crop along that axis is the whole
+    (smaller) image.
+
+    With align > 1 every offset is a multiple of `align` (e.g. the encoder stride, so
+    crops can be cut out of the features of a larger encoding). The image (and the
+    crop size) must then be multiples of `align`, or be padded to them with pad=True.
+    """
+    def __init__(self, height: int, width: int, crop_size: tuple, pad: bool = False, align: int = 1):
+        self.height = height
+        self.width = width
+        self.crop_h, self.crop_w = int(crop_size[0]), int(crop_size[1])
+        self.pad = pad
+        self.align = align
+        # Whether every crop has the full crop size without padding
+        self.fits = height >= self.crop_h and width >= self.crop_w
+        if pad:
+            padded_h, padded_w = max(height, self.crop_h), max(width, self.crop_w)
+            self.padded_shape = (padded_h + -padded_h % align, padded_w + -padded_w % align)
+        else:
+            self.padded_shape = (height, width)
+        if align > 1 and any(size % align for size in self.padded_shape + (self.crop_h, self.crop_w)):
+            raise ValueError(f"Image {self.padded_shape} and crop {crop_size} must be multiples of {align}")
+        self.row_starts = self._starts(self.padded_shape[0], self.crop_h, align)
+        self.col_starts = self._starts(self.padded_shape[1], self.crop_w, align)
+        self.offsets = [(s_h, s_w) for s_h in self.row_starts for s_w in self.col_starts]
+
+    @staticmethod
+    def _starts(length: int, crop: int, align: int = 1) -> list:
+        """Start positions of the crops along one axis."""
+        if length <= crop:
+            return [0]
+        times = math.ceil(length / crop)
+        if align == 1:
+            stride = math.ceil((crop * times - length) / (times - 1)) # Overlap between neighbouring crops
+            starts = [j * (crop - stride) for j in range(times)]
+            starts[-1] = length - crop # Ensure last crop fits
+            return starts
+        # Spread the crops evenly and round each start down to the alignment. Rounding can open a gap
+        # between two crops when they barely overlap, so add a crop until they cover the whole axis.
+        while True:
+            starts = [j * (length - crop) // (times - 1) // align * align for j in range(times)]
+            if all(b - a <= crop for a, b in zip(starts, starts[1:])):
+                return starts
+            times += 1
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def slices(self, start: int = 0, stop: int = None):
+        """Yields the (row slice, column slice) of each crop."""
+        for s_h, s_w in self.offsets[start:stop]:
+            yield slice(s_h, s_h + self.crop_h), slice(s_w, s_w + self.crop_w)
+
+    def pad_image(self, img: np.ndarray, mode: str = 'symmetric') -> np.ndarray:
+        """Pads the image at the bottom/right to `padded_shape`. Returns the image itself if no padding is needed."""
+        pad_h = self.padded_shape[0] - img.shape[0]
+        pad_w = self.padded_shape[1] - img.shape[1]
+        if pad_h <= 0 and pad_w <= 0:
+            return img
+        padding = ((0, max(0, pad_h)), (0, max(0, pad_w))) + ((0, 0),) * (img.ndim - 2)
+        return np.pad(img, padding, mode)
+
+    def crops(self, img: np.ndarray, start: int = 0, stop: int = None):
+        """
+        Lazily yields the crops of `start:stop` as views into the image.
+        With pad=True, `img` must already have been passed through `pad_image`.
+        """
+        for rows, cols in self.slices(start, stop):
+            yield img[rows, cols]
@@ -5,9 +5,9 @@
 import os
 
 import numpy as np
-import math
 from PIL import Image
 
+from .crop_plan import CropPlan
 from .utils import resize_and_crop, get_square, normalize, hwc_to_chw
 import utils.joint_transforms as joint_transforms
 
@@ -245,24 +245,7 @@ def create_crops(img, size):
         raise ValueError(
             "Cannot crop area {} from image with size ({}, {})".format(str(size), h, w))
 
-    h_rate = h/c_h
-    w_rate = w/c_w
-    h_times = math.ceil(h_rate)
-    w_times = math.ceil(w_rate)
-    stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))
-    stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-    crop_imgs = []
-    for j in range(h_times):
-        for i in range(w_times):
-            s_h = int(j*c_h - j*stride_h)
-            if(j==(h_times-1)): s_h = h - c_h
-            e_h = s_h + c_h
-            s_w = int(i*c_w - i*stride_w)
-            if(i==(w_times-1)): s_w = w - c_w
-            e_w = s_w + c_w
-            # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-            crop_im = img[s_h:e_h, s_w:e_w, :]
-            crop_imgs.append(crop_im)
+    crop_imgs = list(CropPlan(h, w, size).crops(img))
 
     crop_imgs_f = []
     for im in crop_imgs:
@@ -282,24 +265,7 @@ def create_crops_1C(img, size):
         raise ValueError(
             "Cannot crop area {} from image with size ({}, {})".format(str(size), h, w))
 
-    h_rate = h/c_h
-    w_rate = w/c_w
-    h_times = math.ceil(h_rate)
-    w_times = math.ceil(w_rate)
-    stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))
-    stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-    crop_imgs = []
-    for j in range(h_times):
-        for i in range(w_times):
-            s_h = int(j*c_h - j*stride_h)
-            if(j==(h_times-1)): s_h = h - c_h
-            e_h = s_h + c_h
-            s_w = int(i*c_w - i*stride_w)
-            if(i==(w_times-1)): s_w = w - c_w
-            e_w = s_w + c_w
-            # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-            crop_im = img[s_h:e_h, s_w:e_w]
-            crop_imgs.append(crop_im)
+    crop_imgs = list(CropPlan(h, w, size).crops(img))
 
     crop_imgs_f = []
     for im in crop_imgs:
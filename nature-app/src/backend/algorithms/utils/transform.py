@@ -8,6 +8,8 @@ import skimage
 from skimage import transform as sktransf
 import matplotlib.pyplot as plt
 
+from .crop_plan import CropPlan
+
 def showIMG(img):
     plt.imshow(img)
     plt.show()
@@ -166,7 +168,6 @@ def rand_rotate_mix(img, label, x_s):
 def create_crops(ims, labels, size):
     crop_imgs = []
     crop_labels = []
-    label_dims = len(labels[0].shape)
     for img, label,  in zip(ims, labels):
         h = img.shape[0]
         w = img.shape[1]
@@ -177,31 +178,9 @@ def create_crops(ims, labels, size):
             crop_imgs.append(img)
             crop_labels.append(label)
             continue
-        h_rate = h/c_h
-        w_rate = w/c_w
-        h_times = math.ceil(h_rate)
-        w_times = math.ceil(w_rate)
-        if h_times==1: stride_h=0
-        else:
-            stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))            
-        if w_times==1: stride_w=0
-        else:
-            stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-        for j in range(h_times):
-            for i in range(w_times):
-                s_h = int(j*c_h - j*stride_h)
-                if(j==(h_times-1)): s_h = h - c_h
-                e_h = s_h + c_h
-                s_w = int(i*c_w - i*stride_w)
-                if(i==(w_times-1)): s_w = w - c_w
-                e_w = s_w + c_w
-                # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-                # print('%d %d %d %d'%(s_h_s, e_h_s, s_w_s, e_w_s))
-                crop_imgs.append(img[s_h:e_h, s_w:e_w, :])
-                if label_dims==2:
-                    crop_labels.append(label[s_h:e_h, s_w:e_w])
-                else:
-                    crop_labels.append(label[s_h:e_h, s_w:e_w, :])
+        for rows, cols in CropPlan(h, w, size).slices():
+            crop_imgs.append(img[rows, cols, :])
+            crop_labels.append(label[rows, cols])
 
     print('Sliding crop finished. %d images created.' %len(crop_imgs))
     return crop_imgs, crop_labels
@@ -216,51 +195,18 @@ def create_crops_onlyimgs(ims, size):
         if h < c_h or w < c_w:
             print("Cannot crop area {} from image with size ({}, {})".format(str(size), h, w))
             continue
-        h_rate = h/c_h
-        w_rate = w/c_w
-        h_times = math.ceil(h_rate)
-        w_times = math.ceil(w_rate)
-        stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))
-        stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-        for j in range(h_times):
-            for i in range(w_times):
-                s_h = int(j*c_h - j*stride_h)
-                if(j==(h_times-1)): s_h = h - c_h
-                e_h = s_h + c_h
-                s_w = int(i*c_w - i*stride_w)
-                if(i==(w_times-1)): s_w = w - c_w
-                e_w = s_w + c_w
-                # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-                # print('%d %d %d %d'%(s_h_s, e_h_s, s_w_s, e_w_s))
-                crop_imgs.append(img[s_h:e_h, s_w:e_w, :])
+        crop_imgs.extend(CropPlan(h, w, size).crops(img))
 
     print('Sliding crop finished. %d images created.' %len(crop_imgs))
     return crop_imgs
 
 def sliding_crop_single_img(img, size):
-    crop_imgs = []
     h = img.shape[0]
     w = img.shape[1]
     c_h = size[0]
     c_w = size[1]
     assert h >= c_h and w >= c_w, "Cannot crop area from image."
-    h_rate = h/c_h
-    w_rate = w/c_w
-    h_times = math.ceil(h_rate)
-    w_times = math.ceil(w_rate)
-    stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))
-    stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-    for j in range(h_times):
-        for i in range(w_times):
-            s_h = int(j*c_h - j*stride_h)
-            if(j==(h_times-1)): s_h = h - c_h
-            e_h = s_h + c_h
-            s_w = int(i*c_w - i*stride_w)
-            if(i==(w_times-1)): s_w = w - c_w
-            e_w = s_w + c_w
-            # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-            # print('%d %d %d %d'%(s_h_s, e_h_s, s_w_s, e_w_s))
-            crop_imgs.append(img[s_h:e_h, s_w:e_w, :])
+    crop_imgs = list(CropPlan(h, w, size).crops(img))
 
     #print('Sliding crop finished. %d images created.' %len(crop_imgs))
     return crop_imgs
@@ -278,43 +224,28 @@ def slidding_crop_WC(imgs_s, labels_s, ims, labels, crop_size_global, crop_size_
         w = img.shape[1]
         offset = int((crop_size_global-crop_size_local)/2)
         if h < crop_size_local or w < crop_size_local:
-            print("Cannot crop area {} from image with size ({}, {})".format(str(size), h, w))
+            print("Cannot crop area {} from image with size ({}, {})".format(str(crop_size_local), h, w))
             crop_imgs.append(img)
             crop_labels.append(label)
             continue
-        h_rate = h/crop_size_local
-        w_rate = w/crop_size_local
-        h_times = math.ceil(h_rate)
-        w_times = math.ceil(w_rate)
-        if h_times==1: stride_h=0
-        else:
-            stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))            
-        if w_times==1: stride_w=0
-        else:
-            stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-        for j in range(h_times):
-            for i in range(w_times):
-                s_h = int(j*c_h - j*stride_h)
-                if(j==(h_times-1)): s_h = h - c_h
-                e_h = s_h + c_h
-                s_w = int(i*c_w - i*stride_w)
-                if(i==(w_times-1)): s_w = w - c_w
-                e_w = s_w + c_w
-                
-                s_h_s = int(s_h/scale)
-                s_w_s = int(s_w/scale)
-                e_h_s = int((e_h+2*offset)/scale)
-                e_w_s = int((e_w+2*offset)/scale)
-                # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-                # print('%d %d %d %d'%(s_h_s, e_h_s, s_w_s, e_w_s))
-                crop_imgs.append(img[s_h:e_h, s_w:e_w, :])
-                crop_imgs_s.append(img_s[s_h_s:e_h_s, s_w_s:e_w_s, :])
-                if label_dims==2:
-                    crop_labels.append(label[s_h:e_h, s_w:e_w])
-                    crop_labels_s.append(label_s[s_h_s:e_h_s, s_w_s:e_w_s])
-                else:
-                    crop_labels.append(label[s_h:e_h, s_w:e_w, :])
-                    crop_labels_s.append(label_s[s_h_s:e_h_s, s_w_s:e_w_s, :])
+        for s_h, s_w in CropPlan(h, w, (c_h, c_w)):
+            e_h = s_h + c_h
+            e_w = s_w + c_w
+            
+            s_h_s = int(s_h/scale)
+            s_w_s = int(s_w/scale)
+            e_h_s = int((e_h+2*offset)/scale)
+            e_w_s = int((e_w+2*offset)/scale)
+            # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
+            # print('%d %d %d %d'%(s_h_s, e_h_s, s_w_s, e_w_s))
+            crop_imgs.append(img[s_h:e_h, s_w:e_w, :])
+            crop_imgs_s.append(img_s[s_h_s:e_h_s, s_w_s:e_w_s, :])
+            if label_dims==2:
+                crop_labels.append(label[s_h:e_h, s_w:e_w])
+                crop_labels_s.append(label_s[s_h_s:e_h_s, s_w_s:e_w_s])
+            else:
+                crop_labels.append(label[s_h:e_h, s_w:e_w, :])
+                crop_labels_s.append(label_s[s_h_s:e_h_s, s_w_s:e_w_s, :])
 
     print('Sliding crop finished. %d images created.' %len(crop_imgs))
     return crop_imgs_s, crop_labels_s, crop_imgs, crop_labels
@@ -471,32 +402,7 @@ def sliding_crop(img, size):
         print("Cannot crop area {} from image with size ({}, {})"
               .format(str(size), h, w))
     else:
-        h_rate = h/c_h
-        w_rate = w/c_w
-        h_times = math.ceil(h_rate)
-        w_times = math.ceil(w_rate)
-        stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))
-        stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-        crop_imgs = []
-        for j in range(h_times):
-            for i in range(w_times):
-                s_h = int(j*c_h - j*stride_h)
-                if(j==(h_times-1)): s_h = h - c_h
-                e_h = s_h + c_h
-                s_w = int(i*c_w - i*stride_w)
-                if(i==(w_times-1)): s_w = w - c_w
-                e_w = s_w + c_w
-                # print('%d %d %d %d'%(s_h, e_h, s_w, e_w))
-                crop_im = img[s_h:e_h, s_w:e_w, :]
-                crop_imgs.append(crop_im)
-
-                # crop_imgs_f = []
-                # for im in crop_imgs:
-                #     crop_imgs_f.append(cv2.flip(im, -1))
-
-                # crops = np.concatenate((np.array(crop_imgs)), axis=0)
-                # print(crops.shape)
-        return crop_imgs
+        return list(CropPlan(h, w, size).crops(img))
 
 def random_crop(img, label, size):
     # print(img.shape)
@@ -593,27 +499,17 @@ def create_crops_mix(ims, labels, x_s, size, scale=1/8):
         if h < c_h or w < c_w:
             print("Cannot crop area {} from image with size ({}, {})".format(str(size), h, w))
             continue
-        h_rate = h/c_h
-        w_rate = w/c_w
-        h_times = math.ceil(h_rate)
-        w_times = math.ceil(w_rate)
-        stride_h = math.ceil(c_h*(h_times-h_rate)/(h_times-1))
-        stride_w = math.ceil(c_w*(w_times-w_rate)/(w_times-1))
-        for j in range(h_times):
-            for i in range(w_times):
-                s_h = int(j*c_h - j*stride_h)
-                s_h_s = int(s_h*scale)
-                if(j==(h_times-1)): s_h = h - c_h
-                e_h = s_h + c_h
-                e_h_s = s_h_s + c_h_s
-                s_w = int(i*c_w - i*stride_w)
-                s_w_s = int(s_w*scale)
-                if(i==(w_times-1)): s_w = w - c_w
-                e_w = s_w + c_w
-                e_w_s = s_w_s + c_w_s
-                crop_imgs.append(img[s_h:e_h, s_w:e_w, :])
-                crop_labels.append(label[s_h:e_h, s_w:e_w, :])
-                crop_x_s.append(x[:, s_h_s:e_h_s, s_w_s:e_w_s])
+        # The crops of x (at `scale` of the image) start at the scaled offsets of the image crops
+        for s_h, s_w in CropPlan(h, w, size):
+            s_h_s = int(s_h*scale)
+            e_h = s_h + c_h
+            e_h_s = s_h_s + c_h_s
+            s_w_s = int(s_w*scale)
+            e_w = s_w + c_w
+            e_w_s = s_w_s + c_w_s
+            crop_imgs.append(img[s_h:e_h, s_w:e_w, :])
+            crop_labels.append(label[s_h:e_h, s_w:e_w, :])
+            crop_x_s.append(x[:, s_h_s:e_h_s, s_w_s:e_w_s])
 
     print('Sliding crop finished. %d images created.' %len(crop_imgs))
     return crop_imgs, crop_labels, crop_x_s
@@ -111,6 +111,27 @@ def rle_encode(mask_image):
     return runs
 
 
+def mask_to_coco_rle(mask):
+    """
+    Lossless, uncompressed COCO RLE of a binary mask: alternating run lengths of
+    background and foreground pixels in column-major order, starting with background.
+    """
+    pixels = (np.asarray(mask) > 0).ravel(order='F')
+    changes = np.flatnonzero(pixels[1:] != pixels[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [pixels.size])))
+    if pixels.size and pixels[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": list(mask.shape[:2]), "counts": counts.tolist()}
+
+
+def coco_rle_to_mask(rle):
+    """Decodes an uncompressed COCO RLE back into a uint8 mask of 0s and 1s."""
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.zeros(len(counts), dtype=np.uint8)
+    values[1::2] = 1
+    return np.repeat(values, counts).reshape(rle["size"], order='F')
+
+
 class AverageMeter(object):
     """Computes and stores the average and current value"""
     def __init__(self):
@@ -0,0 +1,67 @@
+"""
+Measures per-crop FastSAM encoder overhead in SAM_CD.
+
+Compares the original path, which built a new FastSAMPredictor and ran setup_model for
+every call (what `FastSAM.predict` used to do), a full forward of the persistent predictor's model (Segment head
+included) and the features-only `SAM_CD.run_encoder` path.
+
+Usage (from src/backend):
+    python -m benchmarks.bench_encoder --crops 20 --crop-size 512
+"""
+import argparse
+import time
+
+import torch
+
+from algorithms.models.FastSAM.fastsam import FastSAMPredictor
+from algorithms.models.SAM_CD import SAM_CD
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crops", type=int, default=20, help="number of crops to encode")
+    parser.add_argument("--crop-size", type=int, default=512, help="crop height and width")
+    parser.add_argument("--device", type=str, default="cpu", help="device to run on")
+    return parser.parse_args()
+
+
+def time_encoder(encode, crops):
+    # First call is excluded so one-off model fusing/warmup does not skew the average
+    encode(crops[0])
+    start = time.perf_counter()
+    for crop in crops:
+        encode(crop)
+    return (time.perf_counter() - start) / len(crops)
+
+
+def main(args):
+    net = SAM_CD(device=args.device).eval()
+    crops = [torch.rand(1, 3, args.crop_size, args.crop_size) for _ in range(args.crops)]
+
+    def predict_path(image):
+        # A fresh predictor per call, as FastSAM.predict did before it kept one around
+        overrides = dict(task='segment', mode='predict', save=False, verbose=False, device=net.device,
+                         retina_masks=net.retina_masks, imgsz=args.crop_size, conf=net.conf, iou=net.iou)
+        predictor = FastSAMPredictor(overrides=overrides)
+        predictor.setup_model(model=net.model.model, verbose=False)
+        return predictor(image)
+
+    def head_path(image):
+        predictor = net.setup_encoder()
+        im = image.to(predictor.device)
+        im = im.half() if predictor.model.fp16 else im.float()
+        return predictor.model(im, augment=False, visualize=False)[-1]
+
+    with torch.no_grad():
+        before = time_encoder(predict_path, crops)
+        with_head = time_encoder(head_path, crops)
+        after = time_encoder(net.run_encoder, crops)
+
+    print(f"Predictor per call:     {before * 1000:.1f} ms/crop")
+    print(f"Full model forward:     {with_head * 1000:.1f} ms/crop")
+    print(f"Features-only encoder:  {after * 1000:.1f} ms/crop")
+    print(f"Overhead removed:       {(before - after) * 1000:.1f} ms/crop")
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,85 @@
+"""
+Compares change detection accuracy and latency for different FastSAM encoder input sizes.
+
+Each image pair of a LEVIR-CD style split (A/, B/ and label/ folders with matching .png
+names) is run through OrthoAnalysis.predict_change with 512px crops, once per encoder
+size. "crop" encodes every crop at its own size; a number resizes each crop to that size
+before the encoder (1024 upscales the 512px crops 4x in pixels). Prints a markdown table
+with F1, IoU and the mean latency per image pair, and appends it to --output if given.
+
+No results have been recorded yet. The default encoder size (crop) was chosen because it encodes
+4x fewer pixels than upscaling 512px crops to 1024, not because it was measured to be as accurate.
+
+Usage (from src/backend):
+    python -m benchmarks.bench_encoder_size --data /path/to/LEVIR-CD/test --sizes crop 1024 --output encoder_size.md
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from skimage import io
+
+from algorithms.ortho_analysis import OrthoAnalysis
+from algorithms.utils.metric_tool import ConfuseMatrixMeter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", type=str, required=True, help="folder with A/, B/ and label/ subfolders")
+    parser.add_argument("--sizes", type=str, nargs="+", default=["crop", "1024"],
+                        help="encoder input sizes to compare ('crop' follows the crop size)")
+    parser.add_argument("--crop-size", type=int, default=512, help="crop height and width")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N image pairs")
+    parser.add_argument("--tta-policy", type=str, default="none", help="TTA policy used for every run")
+    parser.add_argument("--checkpoint", type=str, default=None, help="SAM_CD checkpoint (auto-detected if omitted)")
+    parser.add_argument("--device", type=str, default="cpu", help="device to run on")
+    parser.add_argument("--output", type=str, default=None, help="markdown file the results table is appended to")
+    return parser.parse_args()
+
+
+def load_pairs(data_dir, limit):
+    names = sorted(name for name in os.listdir(os.path.join(data_dir, "A")) if name.endswith(".png"))[:limit]
+    for name in names:
+        img_a = io.imread(os.path.join(data_dir, "A", name))[..., :3]
+        img_b = io.imread(os.path.join(data_dir, "B", name))[..., :3]
+        label = io.imread(os.path.join(data_dir, "label", name))
+        yield img_a, img_b, (label > 0).astype(np.uint8)
+
+
+def evaluate(analysis, args):
+    meter = ConfuseMatrixMeter(n_class=2)
+    elapsed = []
+    for img_a, img_b, label in load_pairs(args.data, args.limit):
+        start = time.perf_counter()
+        result = analysis.predict_change(img_a, img_b, crop_size=(args.crop_size, args.crop_size), tta_policy=args.tta_policy)
+        elapsed.append(time.perf_counter() - start)
+        pred = (OrthoAnalysis.deserialize_mask(result["mask"]) > 0).astype(np.uint8)
+        meter.update_cm(pr=pred, gt=label)
+    scores = meter.get_scores()
+    # The first pair includes cuDNN autotuning and allocator warmup
+    latency = np.mean(elapsed[1:] if len(elapsed) > 1 else elapsed)
+    return scores["F1_1"], scores["iou_1"], latency
+
+
+def main(args):
+    rows = []
+    for size in args.sizes:
+        encoder_imgsz = None if size == "crop" else int(size)
+        analysis = OrthoAnalysis(model_checkpoint_path=args.checkpoint, device=args.device, encoder_imgsz=encoder_imgsz)
+        f1, iou, latency = evaluate(analysis, args)
+        label = f"{args.crop_size} (crop)" if encoder_imgsz is None else str(encoder_imgsz)
+        rows.append((label, f1, iou, latency))
+
+    lines = [f"| Encoder input | F1 | IoU | s/pair ({args.device}, {args.crop_size}px crops, TTA {args.tta_policy}) |",
+             "|---|---|---|---|"]
+    lines += [f"| {label} | {f1:.4f} | {iou:.4f} | {latency:.2f} |" for label, f1, iou, latency in rows]
+    table = "\n".join(lines)
+    print(table)
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(f"{os.path.basename(os.path.normpath(args.data))}, checkpoint {args.checkpoint or 'auto'}\n\n{table}\n\n")
+
+
+if __name__ == "__main__":
+    main(parse_args())
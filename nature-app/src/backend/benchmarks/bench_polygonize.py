@@ -0,0 +1,50 @@
+"""
+Compares the two polygonization engines of OrthoAnalysis._mask_to_polygons on large
+synthetic change masks.
+
+Usage (from src/backend):
+    python -m benchmarks.bench_polygonize --sizes 1024 4096
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from algorithms.ortho_analysis import OrthoAnalysis
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 4096], help="mask side lengths in pixels")
+    parser.add_argument("--resolution", type=float, default=0.125, help="ground resolution in meters per pixel")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the synthetic masks")
+    return parser.parse_args()
+
+
+def synthetic_mask(size, rng):
+    # Smoothed noise gives blob-shaped regions, including regions with holes
+    return ((ndimage.gaussian_filter(rng.random((size, size)), 3) > 0.52) * 255).astype(np.uint8)
+
+
+def main(args):
+    # Polygonization does not need the network, so skip loading the checkpoint
+    analysis = OrthoAnalysis.__new__(OrthoAnalysis)
+    rng = np.random.default_rng(args.seed)
+
+    for size in args.sizes:
+        mask = synthetic_mask(size, rng)
+        extent = size * args.resolution
+        bbox = [720000, 6170000, 720000 + extent, 6170000 + extent]
+        print(f"{size}x{size} changed area from pixel count: {np.count_nonzero(mask) * args.resolution ** 2:.1f} m2")
+        for engine in ("contours", "shapes"):
+            start = time.perf_counter()
+            polygons = analysis._mask_to_polygons(mask, bbox, min_area=0, engine=engine)
+            elapsed = time.perf_counter() - start
+            holes = sum(len(polygon.interiors) for polygon in polygons)
+            area = sum(polygon.area for polygon in polygons)
+            print(f"  {engine:>8}: {elapsed:6.2f}s, {len(polygons)} polygons, {holes} holes, {area:.1f} m2")
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,5 +1,9 @@
 from database.results import ResultsAccess
-from exceptions import InvalidAlgorithmException, NoAnalysisTypeException
+from exceptions import (
+    AnalysisQueueFullException,
+    InvalidAlgorithmException,
+    NoAnalysisTypeException,
+)
 from fastapi import HTTPException, status
 from models import AnalysisBody
 from services.algorithm_service import AlgorithmService
@@ -18,6 +22,12 @@ class ResultsController():
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Missing analysis type in request body",
                 )
+        except AnalysisQueueFullException:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many analyses in progress, try again later",
+                headers={"Retry-After": "30"},
+                )
         except InvalidAlgorithmException:
             return HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -29,8 +39,8 @@ class ResultsController():
                 detail=f"Could not process request: {e}",
                 )
     
-    async def get_results(self, user_id: int, session: Session, offset: int = 0, limit: int = 10):
-        return await db_results.get_results(session, offset=offset, limit=limit, user_id=user_id)
+    async def get_results(self, user_id: int, session: Session, offset: int = 0, limit: int = 10, before_id: int | None = None):
+        return await db_results.get_results(session, offset=offset, limit=limit, user_id=user_id, before_id=before_id)
     
     async def get_result_by_id(self, session: Session, result_id: int, user_id: int):
         try:
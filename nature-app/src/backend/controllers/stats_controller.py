@@ -0,0 +1,6 @@
+from services.algorithm_service import analysis_queue
+
+
+class StatsController():
+    async def get_stats(self):
+        return {"analysis_queue": analysis_queue.stats()}
@@ -2,8 +2,8 @@ from datetime import datetime
 from typing import Annotated
 
 from fastapi import Query
-from models import AnalysisBody, Results
-from sqlmodel import Session, select
+from models import AnalysisBody, Results, ResultSummary
+from sqlmodel import Session, select, update
 
 
 class ResultsAccess:
@@ -34,6 +34,7 @@ class ResultsAccess:
 
         results.status = "Complete"
         results.result = result
+        results.summary = self._summarize(result)
         results.completed_at = datetime.now()
         error_message = result.get("error_message")
         if error_message:
@@ -46,17 +47,44 @@ class ResultsAccess:
 
         return results.result_id
     
+    async def fail_running_results(self, session: Session, error_message: str) -> int:
+        """
+        Marks every RUNNING result as Error. Called on startup, when no worker is left that could still finish them.
+        Returns the number of results that were marked.
+        """
+        statement = (update(Results).where(Results.status == "RUNNING")
+                     .values(status="Error", error_message=error_message, completed_at=datetime.now()))
+        count = session.execute(statement).rowcount
+        session.commit()
+        return count
+
     async def get_results(self, session: Session,
         offset: int = 0,
         limit: Annotated[int, Query(le=100)] = 100,
         user_id: int = None,
-    ) -> list[Results]:
-        statement = select(Results)
+        before_id: int | None = None,
+    ) -> list[ResultSummary]:
+        """
+        Lists results newest first without loading the stored masks and polygons.
+        Pages with keyset pagination: pass the last result_id of a page as before_id to get the next one.
+        offset pages use the same newest first order (they used to be in insertion order).
+        Rows without a summary (e.g. failed before it was stored) list zero polygons and area.
+        """
+        statement = select(Results.result_id, Results.status, Results.analysis_type, Results.analysis_date,
+                           Results.requested_at, Results.completed_at, Results.error_message, Results.summary)
         if user_id is not None:
             statement = statement.where(Results.user_id == user_id)
-        statement = statement.offset(offset).limit(limit)
-        results = session.exec(statement).all()
-        return results
+        if before_id is not None:
+            statement = statement.where(Results.result_id < before_id)
+        elif offset:
+            # Kept for older clients, keyset pagination does not slow down with history length
+            statement = statement.offset(offset)
+        statement = statement.order_by(Results.result_id.desc()).limit(limit)
+        rows = session.exec(statement).all()
+        return [ResultSummary(result_id=row.result_id, status=row.status, analysis_type=row.analysis_type,
+                              analysis_date=row.analysis_date, requested_at=row.requested_at,
+                              completed_at=row.completed_at, error_message=row.error_message, **(row.summary or {}))
+                for row in rows]
     
     async def get_result_by_id(self, session: Session, result_id: int, user_id: int = None) -> Results | None:
         statement = select(Results).where(Results.result_id == result_id)
@@ -64,3 +92,11 @@ class ResultsAccess:
             statement = statement.where(Results.user_id == user_id)
         result = session.exec(statement).first()
         return result
+
+    def _summarize(self, result: dict) -> dict:
+        polygons = result.get("polygons") or []
+        return {
+            "polygon_count": len(polygons),
+            "changed_area": float(sum(polygon.get("area", 0.0) for polygon in polygons)),
+            "bbox": result.get("bbox"),
+        }
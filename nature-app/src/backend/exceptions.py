@@ -2,4 +2,7 @@ class NoAnalysisTypeException(Exception):
     pass
 
 class InvalidAlgorithmException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class AnalysisQueueFullException(Exception):
+    pass
@@ -1,10 +1,13 @@
 
 import os
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import auth_routes, results_routes, users_routes
+from routes import auth_routes, results_routes, stats_routes, users_routes
+from services.algorithm_service import AlgorithmService, analysis_queue
+from services.workspace import workspace_manager
 
 # Load environment variables
 load_dotenv()
@@ -17,7 +20,21 @@ CORS_ALLOW_ORIGINS = os.getenv("CORS_ALLOW_ORIGINS")
 CORS_ALLOW_METHODS = os.getenv("CORS_ALLOW_METHODS")
 CORS_ALLOW_HEADERS = os.getenv("CORS_ALLOW_HEADERS")
 
-app = FastAPI(title=API_TITLE, root_path=API_ROOT_PATH, version=API_VERSION)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Workspaces of analyses that were running when the app last stopped
+    workspace_manager.cleanup_stale()
+    # Results of those analyses would otherwise stay RUNNING, as nothing is left to finish them
+    await AlgorithmService().fail_interrupted_analyses()
+    # With PRELOAD_MODELS, analysis workers load model weights in their initializer before the first
+    # job arrives; otherwise each worker loads them during its first job
+    await analysis_queue.start()
+    yield
+    await analysis_queue.stop()
+
+
+app = FastAPI(title=API_TITLE, root_path=API_ROOT_PATH, version=API_VERSION, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +47,7 @@ app.add_middleware(
 app.include_router(users_routes.router)
 app.include_router(results_routes.router)
 app.include_router(auth_routes.router)
+app.include_router(stats_routes.router)
 
 
 
@@ -1,9 +1,13 @@
 from datetime import datetime
+from typing import Literal
 
 from pydantic import BaseModel
 from sqlmodel import JSON, Column, Field, SQLModel
 
 
+# Test time augmentation policies of OrthoAnalysis (TTA_POLICIES), validated at the API boundary
+TtaPolicy = Literal["none", "2-way", "flips-only", "4-way"]
+
 class Users(SQLModel, table=True):
     user_id: int = Field(primary_key=True)
     username: str = Field(max_length=25)
@@ -28,9 +32,20 @@ class AnalysisBody(BaseModel):
     end_date: str
     bbox: list
     requested_at: datetime
+    tta_policy: TtaPolicy | None = None # Defaults to the algorithm's setting
 
 class AnalysisPayload(BaseModel):
     result_id: int
+    status: str = "RUNNING"
+
+class AnalysisJob(BaseModel):
+    result_id: int
+    analysis_type: str
+    bbox: list
+    start_date: datetime
+    end_date: datetime
+    layers: list
+    tta_policy: TtaPolicy | None = None
 
 class Results(SQLModel, table=True):
     result_id: int | None = Field(default=None, primary_key=True)
@@ -44,3 +59,16 @@ class Results(SQLModel, table=True):
     completed_at: datetime | None = Field(default=None)
     error_message: str | None = Field(default=None)
     result: dict | None = Field(default=None, sa_column=Column(JSON))
+    summary: dict | None = Field(default=None, sa_column=Column(JSON)) # Small projection of result used by the listing endpoint
+
+class ResultSummary(BaseModel):
+    result_id: int
+    status: str
+    analysis_type: str
+    analysis_date: datetime
+    requested_at: datetime
+    completed_at: datetime | None = None
+    error_message: str | None = None
+    polygon_count: int = 0
+    changed_area: float = 0.0
+    bbox: list | None = None
@@ -93,6 +93,7 @@ CREATE TABLE `results` (
   `completed_at` datetime DEFAULT NULL,
   `error_message` text,
   `result` json DEFAULT NULL,
+  `summary` json DEFAULT NULL,
   PRIMARY KEY (`result_id`),
   KEY `user_id` (`user_id`),
   KEY `location_id` (`location_id`),
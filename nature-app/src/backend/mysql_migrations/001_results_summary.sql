@@ -0,0 +1,18 @@
+-- Adds the results.summary column used by GET /results and fills it in for existing rows.
+-- Databases created from mysql_init/dump.sql after this change already have the column; run this
+-- once against databases created before it:
+--   docker exec -i mysql_db mysql -u root -p nature_app < mysql_migrations/001_results_summary.sql
+
+ALTER TABLE `results` ADD COLUMN `summary` json DEFAULT NULL AFTER `result`;
+
+-- Same fields as ResultsAccess._summarize: polygon count, total changed area and bbox
+UPDATE `results` r
+SET r.`summary` = JSON_OBJECT(
+  'polygon_count', COALESCE(JSON_LENGTH(r.`result`, '$.polygons'), 0),
+  'changed_area', COALESCE((
+    SELECT SUM(p.area)
+    FROM JSON_TABLE(r.`result`, '$.polygons[*]' COLUMNS (area double PATH '$.area' DEFAULT '0' ON EMPTY)) AS p
+  ), 0),
+  'bbox', JSON_EXTRACT(r.`result`, '$.bbox')
+)
+WHERE r.`summary` IS NULL AND r.`result` IS NOT NULL;
@@ -11,10 +11,11 @@ results_controller = ResultsController()
 async def get_results(
     session: SessionDep, 
     user: Users = Depends(get_current_user),
-    offset: int = Query(0, ge=0, description="Number of records to skip"),
-    limit: int = Query(10, ge=1, le=100, description="Number of records to return")
+    offset: int = Query(0, ge=0, description="Number of records to skip, newest first (deprecated, use before_id)"),
+    limit: int = Query(10, ge=1, le=100, description="Number of records to return"),
+    before_id: int | None = Query(None, ge=1, description="Only return results older than this result_id (last id of the previous page)")
 ):
-    return await results_controller.get_results(session=session, user_id=user.user_id, offset=offset, limit=limit)
+    return await results_controller.get_results(session=session, user_id=user.user_id, offset=offset, limit=limit, before_id=before_id)
 
 @router.post("/results/analyse", tags=["results"])
 async def analyse_area( session: SessionDep, body: AnalysisBody, user: Users = Depends(get_current_user)):
@@ -0,0 +1,13 @@
+from controllers.stats_controller import StatsController
+from deps import get_current_user
+from fastapi import APIRouter, Depends
+from models import Users
+
+router = APIRouter()
+stats_controller = StatsController()
+
+
+@router.get("/stats", tags=["stats"])
+async def get_stats(user: Users = Depends(get_current_user)):
+    """Analysis queue state plus model load timings and cache counters reported by the analysis workers."""
+    return await stats_controller.get_stats()
@@ -1,18 +1,27 @@
 
+import asyncio
+import json
 import os
 import re
 from datetime import datetime
 
+import torch
 from algorithms.algo_factory import (  # noqa: F401
     ConcreteAlgorithmFactory,
     InvalidAlgorithmException,
 )
+from algorithms.model_registry import ENCODER_WINDOW, PRELOAD_MODELS, model_registry
+from database.db import engine
 from database.location import LocationAccess
 from database.results import ResultsAccess
-from exceptions import NoAnalysisTypeException  # noqa: F401
-from models import AnalysisBody, AnalysisPayload  # noqa: F401
+from exceptions import AnalysisQueueFullException, NoAnalysisTypeException  # noqa: F401
+from models import AnalysisBody, AnalysisJob, AnalysisPayload  # noqa: F401
+from services.analysis_queue import ANALYSIS_WORKERS, AnalysisQueue
+from services.feature_cache import feature_cache
 from services.image_service import ImageDownloadService
-from skimage import io as ski_io
+from services.tile_cache import tile_cache
+from services.wms_client import get_wms_client
+from services.workspace import workspace_manager
 from sqlmodel import Session
 
 concrete_algorithm_factory = ConcreteAlgorithmFactory()
@@ -39,6 +48,18 @@ class AlgorithmService:
         print("Created analysis")
         analysis_type = body.analysis_type
         bbox = body.bbox
+        if not analysis_type:
+            raise NoAnalysisTypeException
+        if analysis_type not in layers_dict:
+            raise InvalidAlgorithmException
+
+        # Reject before writing any rows when the workers cannot take more work
+        if analysis_queue.is_full():
+            raise AnalysisQueueFullException
+
+        start_date = datetime.strptime(body.start_date, "%Y-%m-%d %H:%M:%S")
+        end_date = datetime.strptime(body.end_date, "%Y-%m-%d %H:%M:%S")
+
         try:
             location_id = await db_location.create_location(session, bbox)
 
@@ -46,40 +67,78 @@ class AlgorithmService:
 
         except Exception as e:
             raise e
-        
-        if not analysis_type:
-            raise NoAnalysisTypeException
-        
-        start_date = datetime.strptime(body.start_date, "%Y-%m-%d %H:%M:%S")
-        end_date = datetime.strptime(body.end_date, "%Y-%m-%d %H:%M:%S")
-        # Download photos for analysis
-        download_paths = await image_service.download_images_for_analysis(analysis_type=analysis_type, bbox=bbox, date_range=(start_date, end_date), layers=self._filter_layers(layers=layers_dict[analysis_type], start_date=start_date, end_date=end_date))
+
+        # The analysis itself runs in the background; the client polls the result by id
+        job = AnalysisJob(result_id=result_id, analysis_type=analysis_type, bbox=bbox, start_date=start_date,
+                          end_date=end_date, tta_policy=body.tta_policy,
+                          layers=self._filter_layers(layers=layers_dict[analysis_type], start_date=start_date, end_date=end_date))
+        try:
+            await analysis_queue.enqueue(job)
+        except AnalysisQueueFullException as e:
+            # The queue filled up while the rows were being created
+            await db_results.update_results(session, result_id, {"error_message": "Analysis queue is full"})
+            raise e
+
+        return AnalysisPayload(result_id=result_id, status="RUNNING")
+
+    def run_analysis(self, job: AnalysisJob) -> int:
+        """
+        Runs a queued job inside an analysis worker and stores its outcome, so neither the
+        inference nor the serialization of the (large) result touches the API event loop.
+        """
+        try:
+            # Anything written to disk for this job lives in its own workspace, removed once the job is done
+            with workspace_manager.acquire(f"analysis_{job.result_id}") as workspace:
+                result = self._predict(job, workspace)
+        except Exception as e:
+            result = {"error_message": str(e)}
+        self.store_analysis_result(job, result)
+        return job.result_id
+
+    def _predict(self, job: AnalysisJob, workspace: str) -> dict:
+        # Download photos for analysis. The images are handed over decoded, without a round trip through disk
+        downloads = asyncio.run(image_service.download_images_for_analysis(analysis_type=job.analysis_type, bbox=job.bbox, date_range=(job.start_date, job.end_date), layers=job.layers, endpoints_only=True, workspace=workspace))
+        images = downloads["images"][0]
+        layers = downloads["layers"][0]
+        if len(images) < 2:
+            raise ValueError("Could not download two orthophotos for the selected period")
         # Retrieve earliest image by date
-        img_a = ski_io.imread(download_paths["files"][0][-1])
+        img_a, layer_a = images[-1], layers[-1]
 
         # Retrieve latest image by date
-        img_b = ski_io.imread(download_paths["files"][0][0])
+        img_b, layer_b = images[0], layers[0]
         
         
         try:
             # Create algorithm based on analysis type
-            algorithm = concrete_algorithm_factory.create_algorithm(analysis_type)
+            algorithm = concrete_algorithm_factory.create_algorithm(job.analysis_type)
         except InvalidAlgorithmException as e:
             raise e
         
         try:
             # Run analysis
-            result = algorithm.predict_change(imgA_bytes=img_a, imgB_bytes=img_b, crop_size=(512, 512), return_polygons=True, bbox=bbox)
+            return algorithm.predict_change(imgA_bytes=img_a, imgB_bytes=img_b, crop_size=(512, 512), return_polygons=True, bbox=job.bbox, tta_policy=job.tta_policy, encoder_window=ENCODER_WINDOW,
+                                            layers=(layer_a, layer_b), feature_cache=feature_cache,
+                                            # The newest layer is the reference that comparisons of other years share
+                                            persist_layers=(layer_b,))
         except Exception as e:
             raise e
-        finally:
-            # Clean up downloaded images after analysis
-            self._cleanup_downloaded_images()
 
-        result_id = await db_results.update_results(session, result_id, result)
-        
-        return AnalysisPayload(result_id=result_id)
-        
+    def store_analysis_result(self, job: AnalysisJob, result: dict):
+        """Writes a finished (or failed) analysis back to its results row. Called from worker threads/processes."""
+        with Session(engine) as session:
+            asyncio.run(db_results.update_results(session, job.result_id, result))
+
+    async def fail_interrupted_analyses(self):
+        """Marks analyses that were still running when the app last stopped as failed, so clients stop polling them."""
+        with Session(engine) as session:
+            count = await db_results.fail_running_results(session, "Analysis was interrupted by a restart")
+        if count:
+            print(f"Marked {count} interrupted analyses as failed")
+
+    def store_analysis_failure(self, job: AnalysisJob, error: Exception):
+        """Marks a job as failed when its worker died before it could store the outcome itself."""
+        self.store_analysis_result(job, {"error_message": str(error)})
     
     def _filter_layers(self, layers: list, start_date: datetime, end_date: datetime) -> list:
         filtered_layers = []
@@ -93,26 +152,38 @@ class AlgorithmService:
 
         return filtered_layers
 
-    def _cleanup_downloaded_images(self):
-        """Delete all downloaded images from the data folder after analysis."""
-        data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
-        
-        if not os.path.exists(data_dir):
-            return
-            
-        for subfolder in ['orthophoto', 'satellite']:
-            subfolder_path = os.path.join(data_dir, subfolder)
-            if os.path.exists(subfolder_path):
-                # Delete all files in the subfolder
-                for file in os.listdir(subfolder_path):
-                    file_path = os.path.join(subfolder_path, file)
-                    if os.path.isfile(file_path):
-                        try:
-                            os.remove(file_path)
-                            print(f"Deleted: {file_path}")
-                        except Exception as e:
-                            print(f"Error deleting {file_path}: {e}")
 
-        
+def run_analysis_job(job: AnalysisJob) -> dict:
+    # Module level so it can be pickled and sent to worker processes
+    result_id = AlgorithmService().run_analysis(job)
+    stats = worker_stats()
+    # One JSON line per job, so the worker's numbers can also be followed in the logs
+    print(json.dumps({"event": "analysis_worker_stats", "result_id": result_id, **stats}))
+    return {"result_id": result_id, "worker_stats": stats}
+
+
+def worker_stats() -> dict:
+    """
+    Snapshot of the state that lives in this worker process. Returned with every job outcome, since
+    the API process has its own (unused) copies of these singletons.
+    """
+    return {
+        "pid": os.getpid(),
+        "model_load_timings": model_registry.get_load_timings(),
+        "tile_cache": tile_cache.stats(),
+        "wms": get_wms_client().metrics(),
+        "feature_cache": feature_cache.stats(),
+    }
+
+
+def init_analysis_worker():
+    # Split the cores between workers so concurrent analyses do not oversubscribe the CPU
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // ANALYSIS_WORKERS))
+    # Each worker process has its own model registry, so load the weights before the first job arrives
+    if PRELOAD_MODELS:
+        model_registry.preload()
+
 
-    
\ No newline at end of file
+analysis_queue = AnalysisQueue(job_handler=run_analysis_job,
+                               failure_handler=AlgorithmService().store_analysis_failure,
+                               worker_initializer=init_analysis_worker)
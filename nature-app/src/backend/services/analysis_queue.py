@@ -0,0 +1,148 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from exceptions import AnalysisQueueFullException
+from models import AnalysisJob
+
+# Load environment variables
+load_dotenv()
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "1"))
+ANALYSIS_QUEUE_DEPTH = int(os.getenv("ANALYSIS_QUEUE_DEPTH", "16"))
+# "process" runs analyses in separate worker processes, "thread" keeps them in this process (e.g. for local testing)
+ANALYSIS_WORKER_MODE = os.getenv("ANALYSIS_WORKER_MODE", "process")
+
+
+class AnalysisQueue:
+    """
+    In-process job queue for analyses.
+
+    Requests enqueue jobs and return immediately, or are rejected when the queue is full.
+    A fixed number of consumer tasks pull jobs off the queue and run `job_handler` in a
+    worker pool, so CPU-bound work (image decoding, inference, result serialization and
+    the database write) never runs on the event loop. If a job dies before it could record
+    its own outcome, `failure_handler` is called from a thread with the error. A process pool
+    broken by a crashed worker (e.g. killed for running out of memory) is replaced, so the
+    jobs after it still run.
+
+    Caches and model timings live in the workers, so `job_handler` reports them back: when it
+    returns a dict with "worker_stats" (holding the worker's "pid"), the latest snapshot of
+    each worker is kept and served by `stats`.
+    """
+    def __init__(self, job_handler: Callable[[AnalysisJob], object],
+                 failure_handler: Callable[[AnalysisJob, Exception], None],
+                 workers: int = ANALYSIS_WORKERS, queue_depth: int = ANALYSIS_QUEUE_DEPTH,
+                 worker_mode: str = ANALYSIS_WORKER_MODE, worker_initializer: Optional[Callable] = None):
+        self.job_handler = job_handler
+        self.failure_handler = failure_handler
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.worker_mode = worker_mode
+        self.worker_initializer = worker_initializer
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[Executor] = None
+        self._consumers: list[asyncio.Task] = []
+        self._worker_stats: dict[int, dict] = {} # pid -> latest snapshot reported by that worker
+
+    async def start(self):
+        """Creates the worker pool and starts the consumer tasks. Called once on app startup."""
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        self._executor = self._create_executor()
+        self._consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        print(f"Analysis queue started with {self.workers} {self.worker_mode} worker(s), depth {self.queue_depth}")
+
+    def _create_executor(self) -> Executor:
+        if self.worker_mode == "process":
+            # Spawn instead of fork so worker processes do not inherit torch/thread state from the API process
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=self.worker_initializer)
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis",
+                                          initializer=self.worker_initializer)
+        # Workers are started lazily, so submit a no-op per worker to run the initializers up front
+        for _ in range(self.workers):
+            executor.submit(_start_worker)
+        return executor
+
+    def _replace_broken_executor(self, broken: Executor):
+        # Every consumer with a job on the broken pool ends up here; only the first one replaces it
+        if self._executor is not broken:
+            return
+        print("Analysis worker process died, restarting the worker pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._worker_stats.clear()
+        self._executor = self._create_executor()
+
+    async def stop(self):
+        """
+        Cancels the consumers and shuts the worker pool down. Called on app shutdown. Jobs still waiting in
+        the queue are passed to `failure_handler`, so their results do not stay running forever.
+        """
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        while self._queue is not None and not self._queue.empty():
+            job = self._queue.get_nowait()
+            try:
+                await asyncio.to_thread(self.failure_handler, job, RuntimeError("Analysis was cancelled by a shutdown"))
+            except Exception as store_error:
+                print(f"Could not store failure of analysis {job.result_id}: {store_error}")
+            self._queue.task_done()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def enqueue(self, job: AnalysisJob):
+        """Adds a job to the queue. Raises AnalysisQueueFullException instead of waiting when it is full."""
+        if self._queue is None:
+            raise RuntimeError("Analysis queue has not been started")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise AnalysisQueueFullException()
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        """Queue state and the stats last reported by each worker."""
+        return {
+            "worker_mode": self.worker_mode,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "queued": self.qsize(),
+            "worker_stats": list(self._worker_stats.values()),
+        }
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            executor = self._executor
+            try:
+                outcome = await loop.run_in_executor(executor, self.job_handler, job)
+                if isinstance(outcome, dict) and "worker_stats" in outcome:
+                    self._worker_stats[outcome["worker_stats"]["pid"]] = outcome["worker_stats"]
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._replace_broken_executor(executor)
+                print(f"Analysis {job.result_id} failed: {e}")
+                try:
+                    await asyncio.to_thread(self.failure_handler, job, e)
+                except Exception as store_error:
+                    print(f"Could not store failure of analysis {job.result_id}: {store_error}")
+            finally:
+                self._queue.task_done()
+
+
+def _start_worker():
+    pass
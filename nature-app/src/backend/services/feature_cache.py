@@ -0,0 +1,119 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+from dotenv import load_dotenv
+
+from services.tile_cache import TileCache
+
+# Load environment variables
+load_dotenv()
+
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "feature_cache"))
+# One entry holds the float16 features of one window and TTA view of one image, about 36 bytes per window
+# pixel: ~40MB for a 1024x1024 image, ~80MB for a window at the default memory budget. A 4-way TTA
+# comparison of two 1024x1024 images stores 8 entries (~300MB), so the default keeps about six of them.
+FEATURE_CACHE_MEMORY_MB = int(os.getenv("FEATURE_CACHE_MEMORY_MB", "2048"))
+FEATURE_CACHE_DISK_MB = int(os.getenv("FEATURE_CACHE_DISK_MB", "8192")) # 0 keeps features in memory only
+
+
+class FeatureCache:
+    """
+    Two tier cache for encoder feature maps, so an orthophoto compared against several
+    other years is only encoded once.
+
+    Entries are keyed on (layer, tile bounds, tile shape, encoder version, view). Features are
+    stored as float16 CPU tensors and handed back in the dtype they were stored from. Recently
+    used entries stay in memory, bounded by `memory_bytes`. Entries stored with persist=True
+    (ones the caller expects to be asked for again, e.g. a reference year) are also written to a
+    `TileCache` on disk, which is shared by worker processes and survives restarts. Both tiers
+    evict least-recently-used.
+    """
+    def __init__(self, memory_bytes: int = FEATURE_CACHE_MEMORY_MB * 1024 * 1024, directory: str = FEATURE_CACHE_DIR,
+                 disk_bytes: int = FEATURE_CACHE_DISK_MB * 1024 * 1024):
+        self.memory_bytes = memory_bytes
+        self.disk = TileCache(directory, disk_bytes) if disk_bytes > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (float16 features, original dtype name, size in bytes), least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(layer: str, bounds: list, shape: tuple, padded_shape: tuple, encoder_version: str, view: tuple = ()) -> str:
+        """
+        Key of the features of one tile. bounds are the map coordinates of the tile, shape its size in pixels,
+        padded_shape the size it was padded to before encoding and view the flip dims of the test time
+        augmentation view that was encoded.
+        """
+        raw = json.dumps([layer, [round(float(c), 3) for c in bounds], [int(s) for s in shape],
+                          [int(s) for s in padded_shape], encoder_version, list(view)])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str, device=None) -> Optional[list]:
+        """Returns the cached feature maps (moved to device, in their original dtype), or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            data = self.disk.get(key) if self.disk is not None else None
+            if data is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+            stored = torch.load(io.BytesIO(data), map_location="cpu", weights_only=True)
+            feats, dtype_name = stored["features"], stored["dtype"]
+            with self._lock:
+                self.hits += 1
+                self._remember(key, feats, dtype_name)
+        else:
+            feats, dtype_name = entry[0], entry[1]
+        dtype = getattr(torch, dtype_name)
+        return [feat.to(device=device, dtype=dtype) for feat in feats]
+
+    def put(self, key: str, feats: list, persist: bool = False):
+        """
+        Stores float16 CPU copies of the feature maps in memory, and on disk with persist. The disk write
+        is synchronous and costs about as much as encoding, so only persist features that will be reused.
+        """
+        dtype_name = str(feats[0].dtype).replace("torch.", "")
+        feats = [feat.detach().to(device="cpu", dtype=torch.float16, copy=True) for feat in feats]
+        with self._lock:
+            self._remember(key, feats, dtype_name)
+        if persist and self.disk is not None:
+            buffer = io.BytesIO()
+            torch.save({"features": feats, "dtype": dtype_name}, buffer)
+            self.disk.put(key, buffer.getvalue())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._size,
+                "max_memory_bytes": self.memory_bytes,
+                "disk": self.disk.stats() if self.disk is not None else None,
+            }
+
+    def _remember(self, key: str, feats: list, dtype_name: str):
+        # Caller holds the lock
+        size = sum(feat.element_size() * feat.nelement() for feat in feats)
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[2]
+        self._entries[key] = (feats, dtype_name, size)
+        self._size += size
+        while self._size > self.memory_bytes and self._entries:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+
+# Shared by every analysis in this process
+feature_cache = FeatureCache()
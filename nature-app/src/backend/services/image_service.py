@@ -1,4 +1,7 @@
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import BytesIO
 from typing import List, Literal, Optional, Tuple
 
@@ -6,8 +9,9 @@ import numpy as np
 import rasterio  # For satellite data handling (if needed)
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from owslib.wms import WebMapService
 from PIL import Image
+from services.tile_cache import tile_cache
+from services.wms_client import get_wms_client
 
 # Import shapely for geometry processing
 from sqlmodel import DateTime
@@ -15,6 +19,20 @@ from sqlmodel import DateTime
 # Load environment variables
 load_dotenv()
 
+WMS_MAX_WORKERS = int(os.getenv("WMS_MAX_WORKERS", "4")) # Concurrent GetMap requests per download
+WMS_RETRIES = int(os.getenv("WMS_RETRIES", "2")) # Extra attempts per layer after a failed request
+WMS_RETRY_BACKOFF = float(os.getenv("WMS_RETRY_BACKOFF", "1.0")) # Seconds before the first retry, doubled per attempt
+# Target ground resolution in meters per pixel for tiled downloads (the orthophotos are 12.5cm, e.g. "0.125").
+# Empty (the default) requests one image_size image per layer. A tiled mosaic can be many times larger, and
+# the analysis holds both images in memory, so enable it together with ENCODER_WINDOW on large hosts.
+WMS_GROUND_RESOLUTION = float(os.getenv("WMS_GROUND_RESOLUTION", "") or 0) or None
+WMS_MAX_MOSAIC_PX = int(os.getenv("WMS_MAX_MOSAIC_PX", "4096")) # Longest mosaic side; coarser resolution is used beyond it
+# Side of the global grid cells tiled downloads are made of (512px is 64m at 12.5cm). Small cells keep
+# a small bbox from pulling in much more than it covers, larger ones mean fewer GetMap requests.
+WMS_TILE_PX = int(os.getenv("WMS_TILE_PX", "512"))
+# Also write downloaded images to disk (e.g. for debugging); analyses only use the in-memory arrays
+SAVE_DOWNLOADED_IMAGES = os.getenv("SAVE_DOWNLOADED_IMAGES", "false").lower() == "true"
+
 
 # Re-incorporate the ImageDownloader from Crop_images_SG.py
 # It's better to put it directly into this file or a utils file
@@ -27,72 +45,166 @@ class ImageDownloader:
     """
     def __init__(self, save_directory: str, min_lat: float, min_lon: float,
                  max_lat: float, max_lon: float, image_size: str,
-                 length: int = 512, width: int = 512,
-                 layers: list = []):
+                 length: Optional[float] = None, width: Optional[float] = None,
+                 layers: list = [], endpoints_only: bool = False,
+                 ground_resolution: Optional[float] = None, save_to_disk: bool = SAVE_DOWNLOADED_IMAGES):
         self.save_directory = save_directory
         self.min_lon = min_lon
         self.min_lat = min_lat
         self.max_lon = max_lon
         self.max_lat = max_lat
         self.image_size_x, self.image_size_y = map(int, image_size.split('x'))
-        self.length = length  # Tile length in meters
+        self.length = length  # Tile length in meters when tiling; None uses WMS_TILE_PX pixels
         self.width = width    # Tile width in meters
+        self.ground_resolution = ground_resolution # Meters per pixel. If None, the whole bbox is one image_size request
         self.layers = layers
-        
-        # Build WMS URL from environment variables
-        WMS_BASE_URL = os.getenv("WMS_URL")
-        WMS_USERNAME = os.getenv("WMS_USERNAME")
-        WMS_PASSWORD = os.getenv("WMS_PASSWORD")
-        self.url = f'{WMS_BASE_URL}?username={WMS_USERNAME}&password={WMS_PASSWORD}'
-        self.wms = WebMapService(self.url, version='1.3.0')
-
-    def _download_tile(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float, file_path: str, layer: str):
-        """Helper to download a single tile."""        
-        # Use the same parameters as the working example
-        response = self.wms.getmap(
-            layers=[layer],
-            styles=['default'],  # Use default style like working example
-            srs='EPSG:25832',
-            bbox=[self.min_lat, self.min_lon, self.max_lat, self.max_lon],  # [minx, miny, maxx, maxy] format
-            size=(self.image_size_x, self.image_size_y),
-            format='image/jpeg',  # Use JPEG like working example
-            transparent=True
-        )
-        img = Image.open(BytesIO(response.read()))
-        if img.mode == 'RGBA':
+        self.endpoints_only = endpoints_only # Only fetch the newest and oldest layer (all a date comparison needs)
+        self.save_to_disk = save_to_disk
+        self.saved_files = {} # layer -> path of the copy written when save_to_disk is set
+        self.downloaded_layers = [] # Layer of each image returned by download_images
+
+        # Shared client: capabilities are parsed once per process and GetMap connections are pooled
+        self.wms = get_wms_client()
+
+    def _fetch_tile(self, layer: str, bbox: list, size: tuple) -> np.ndarray:
+        """Fetches one GetMap image as an RGB array. Identical requests are served from the on-disk tile cache."""
+        image_format = 'image/jpeg'  # Use JPEG like working example
+        cache_key = tile_cache.make_key(layer, bbox, size, image_format)
+
+        data = tile_cache.get(cache_key)
+        if data is None:
+            # Use the same parameters as the working example (default style, EPSG:25832, transparent)
+            data = self.wms.getmap(layer, bbox, size, image_format)
+            img = Image.open(BytesIO(data))
+            img.load()
+            # Only cache responses that decode as images, not WMS service exceptions
+            tile_cache.put(cache_key, data)
+        else:
+            img = Image.open(BytesIO(data))
+        if img.mode != 'RGB':
             img = img.convert('RGB')
-        img.save(file_path)
-        print(f"Downloaded tile to: {file_path}")
+        return np.asarray(img)
 
-    def download_images(self) -> List[str]:
+    def _plan_tiles(self, bbox: list) -> Tuple[int, int, list]:
         """
-        Downloads images within the bounding box, potentially tiling if length/width are provided.
-        Once a valid bbox is found, uses the same bbox for all layers.
-        Returns a list of paths to the downloaded images.
+        Covers the bbox with tiles of a global grid at the target ground resolution.
+
+        Tiles are aligned to multiples of the tile size from the EPSG:25832 origin, not to the bbox,
+        so overlapping bboxes request the same tiles and share tile cache entries. Resolutions coarser
+        than the target (for bboxes beyond WMS_MAX_MOSAIC_PX) are powers of two of it for the same reason.
+        Returns the mosaic width and height in pixels and a list of (tile_bbox, tile_size, row, col),
+        with row/col the position of the tile's top left pixel in the mosaic (negative where the tile
+        starts before the bbox).
         """
-        downloaded_paths = []
-        
-        # Get calling files path to create relative path to /data/ folder
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        target_directory = os.path.normpath(os.path.join(script_dir, self.save_directory))
-        self.save_directory = target_directory
-        
-        # Ensure directory exists
-        os.makedirs(self.save_directory, exist_ok=True)
-        
-        # First, find a valid bbox by trying to download from the first layer
-        for layer in self.layers:
-            # First attempt: try the original full bbox as provided
-            file_name = f"{layer}_{self.min_lon}_{self.min_lat}_{self.max_lon}_{self.max_lat}.jpg"
-            file_path = os.path.join(self.save_directory, file_name)
-            
+        min_x, min_y, max_x, max_y = bbox
+        resolution = self.ground_resolution
+        longest_side = max(max_x - min_x, max_y - min_y) / resolution
+        if longest_side > WMS_MAX_MOSAIC_PX:
+            resolution *= 2 ** math.ceil(math.log2(longest_side / WMS_MAX_MOSAIC_PX))
+            print(f"Bbox too large for {self.ground_resolution}m/px, downloading at {resolution:.3f}m/px instead")
+        tile_w = max(1, round(self.width / self.ground_resolution)) if self.width else WMS_TILE_PX
+        tile_h = max(1, round(self.length / self.ground_resolution)) if self.length else WMS_TILE_PX
+
+        # Global pixel grid: columns count east from x=0, rows count south from y=0.
+        # The bbox is snapped to the nearest pixel edges, which moves it by at most half a pixel.
+        left, top = round(min_x / resolution), round(-max_y / resolution)
+        mosaic_w = max(1, round(max_x / resolution) - left)
+        mosaic_h = max(1, round(-min_y / resolution) - top)
+
+        tiles = []
+        for tile_row in range(top // tile_h, (top + mosaic_h - 1) // tile_h + 1):
+            for tile_col in range(left // tile_w, (left + mosaic_w - 1) // tile_w + 1):
+                x0, y1 = tile_col * tile_w * resolution, -tile_row * tile_h * resolution
+                tile_bbox = [x0, y1 - tile_h * resolution, x0 + tile_w * resolution, y1]
+                tiles.append((tile_bbox, (tile_w, tile_h), tile_row * tile_h - top, tile_col * tile_w - left))
+        return mosaic_w, mosaic_h, tiles
+
+    def _fetch_mosaic(self, layer: str, bbox: list) -> np.ndarray:
+        """Fetches the grid tiles in parallel and pastes the part of each one inside the bbox as soon as it arrives."""
+        mosaic_w, mosaic_h, tiles = self._plan_tiles(bbox)
+        mosaic = np.zeros((mosaic_h, mosaic_w, 3), dtype=np.uint8)
+        with ThreadPoolExecutor(max_workers=max(1, min(WMS_MAX_WORKERS, len(tiles)))) as pool:
+            futures = {pool.submit(self._fetch_tile, layer, tile_bbox, size): (row, col)
+                       for tile_bbox, size, row, col in tiles}
+            for future in as_completed(futures):
+                row, col = futures[future]
+                tile = future.result()
+                r0, c0 = max(row, 0), max(col, 0)
+                r1, c1 = min(row + tile.shape[0], mosaic_h), min(col + tile.shape[1], mosaic_w)
+                mosaic[r0:r1, c0:c1] = tile[r0 - row:r1 - row, c0 - col:c1 - col]
+        print(f"Fetched {layer} as {len(tiles)} tile(s) into a {mosaic_w}x{mosaic_h} mosaic")
+        return mosaic
+
+    def _download_tile(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float, layer: str) -> np.ndarray:
+        """Helper to download the bbox for one layer, as one request or as a tiled mosaic at the ground resolution."""
+        bbox = [min_lat, min_lon, max_lat, max_lon]  # [minx, miny, maxx, maxy] format
+        if self.ground_resolution is None:
+            return self._fetch_tile(layer, bbox, (self.image_size_x, self.image_size_y))
+        return self._fetch_mosaic(layer, bbox)
+
+    def _download_layer(self, layer: str) -> Optional[np.ndarray]:
+        """
+        Downloads the bbox for one layer, retrying with backoff. Returns the decoded RGB image,
+        or None if it failed. The image is only written to disk when save_to_disk is set.
+        """
+        for attempt in range(WMS_RETRIES + 1):
             try:
-                self._download_tile(self.min_lon, self.min_lat, self.max_lon, self.max_lat, file_path, layer)
-                downloaded_paths.append(file_path)
+                image = self._download_tile(self.min_lon, self.min_lat, self.max_lon, self.max_lat, layer)
+                break
             except Exception as e:
-                print(f"Failed downloading image for layer {layer}: {e}")
-            
-        return downloaded_paths
+                print(f"Failed downloading image for layer {layer} (attempt {attempt + 1}): {e}")
+                if attempt < WMS_RETRIES:
+                    time.sleep(WMS_RETRY_BACKOFF * 2 ** attempt)
+        else:
+            return None
+
+        if self.save_to_disk:
+            # PNG, so the saved copy is the exact array handed to the analysis
+            file_name = f"{layer}_{self.min_lon}_{self.min_lat}_{self.max_lon}_{self.max_lat}.png"
+            file_path = os.path.join(self.save_directory, file_name)
+            Image.fromarray(image).save(file_path)
+            self.saved_files[layer] = file_path
+            print(f"Saved image to: {file_path}")
+        return image
+
+    def _download_layers(self, layers: list) -> List[Optional[np.ndarray]]:
+        """Downloads several layers concurrently. Results are in the same order as the layers."""
+        with ThreadPoolExecutor(max_workers=max(1, min(WMS_MAX_WORKERS, len(layers)))) as pool:
+            return list(pool.map(self._download_layer, layers))
+
+    def download_images(self) -> List[np.ndarray]:
+        """
+        Downloads images within the bounding box for every layer, fetching the layers concurrently.
+        With endpoints_only, only the first and last layer are fetched, falling back to the closest
+        inner layer when one of them cannot be downloaded.
+        Returns the decoded RGB images (uint8, HxWx3), in layer order. The layer of each image is in
+        `downloaded_layers`; with save_to_disk the paths of the written copies are available in `saved_files`.
+        """
+        if self.save_to_disk:
+            # Get calling files path to create relative path to /data/ folder
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            target_directory = os.path.normpath(os.path.join(script_dir, self.save_directory))
+            self.save_directory = target_directory
+
+            # Ensure directory exists
+            os.makedirs(self.save_directory, exist_ok=True)
+
+        if self.endpoints_only and len(self.layers) > 2:
+            first, last = 0, len(self.layers) - 1
+            first_image, last_image = self._download_layers([self.layers[first], self.layers[last]])
+            while first_image is None and first + 1 < last:
+                first += 1
+                first_image = self._download_layer(self.layers[first])
+            while last_image is None and last - 1 > first:
+                last -= 1
+                last_image = self._download_layer(self.layers[last])
+            downloads = [(self.layers[first], first_image), (self.layers[last], last_image)]
+        else:
+            downloads = list(zip(self.layers, self._download_layers(self.layers)))
+
+        downloads = [(layer, image) for layer, image in downloads if image is not None]
+        self.downloaded_layers = [layer for layer, _ in downloads]
+        return [image for _, image in downloads]
 
 class ImageDownloadService:
     def __init__(self):
@@ -115,17 +227,22 @@ class ImageDownloadService:
         bbox: list,
         image_size: str = "1024x1024",
         date_range: Optional[Tuple[DateTime, DateTime]] = None, # For satellite data: (start_date, end_date) 'YYYY-MM-DD'
-        layers: list = [] # Specific layer for orthophotos
+        layers: list = [], # Specific layer for orthophotos
+        endpoints_only: bool = False, # Only download the newest and oldest layer
+        ground_resolution: Optional[float] = WMS_GROUND_RESOLUTION, # Meters per pixel; None requests one image_size image
+        workspace: Optional[str] = None # Private scratch directory of the calling job for any files written
     ) -> dict:
         """
         Downloads images based on analysis type and polygon.
-        Returns paths to downloaded images.
+        Returns the decoded orthophotos under "images", the layer of each one under "layers" and the paths of
+        any files written to disk under "files".
         """
         try:
-            # Create a unique directory for this request
-            # (You might want a more robust naming/cleanup strategy)
-            download_session_dir = os.path.join(self.base_download_dir, f"{analysis_type}")
+            # Files go to the job's own workspace, so concurrent analyses never touch each other's files
+            download_session_dir = workspace if workspace is not None else os.path.join(self.base_download_dir, f"{analysis_type}")
 
+            downloaded_images = []
+            downloaded_layers = []
             downloaded_files = []
 
             if analysis_type == "orthophoto":
@@ -139,11 +256,15 @@ class ImageDownloadService:
                     max_lat=bbox[2],
                     max_lon=bbox[3],
                     image_size=image_size,
-                    layers=layers
-                    # length and width are optional, if not provided, it gets the whole bbox
+                    layers=layers,
+                    endpoints_only=endpoints_only,
+                    ground_resolution=ground_resolution
+                    # length and width set the tile size in meters when tiling at ground_resolution (default WMS_TILE_PX)
                 )
-                downloaded_files.append(downloader.download_images())
-                print(f"Orthophoto download complete. Files: {downloaded_files}")
+                downloaded_images.append(downloader.download_images())
+                downloaded_layers.append(downloader.downloaded_layers)
+                downloaded_files.append(list(downloader.saved_files.values()))
+                print(f"Orthophoto download complete. Images: {[image.shape for image in downloaded_images[0]]}")
 
             elif analysis_type == "satellite":
                 ##TODO: Insert actual implementation here.
@@ -187,7 +308,7 @@ class ImageDownloadService:
             else:
                 raise ValueError(f"Unsupported analysis_type: {analysis_type}")
 
-            return {"message": "Images downloaded successfully", "files": downloaded_files, "download_path": download_session_dir}
+            return {"message": "Images downloaded successfully", "images": downloaded_images, "layers": downloaded_layers, "files": downloaded_files, "download_path": download_session_dir}
 
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
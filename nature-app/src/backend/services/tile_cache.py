@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "tile_cache"))
+TILE_CACHE_MAX_MB = int(os.getenv("TILE_CACHE_MAX_MB", "2048"))
+
+
+class TileCache:
+    """
+    Content-addressed on-disk cache for WMS GetMap responses.
+
+    Entries are keyed on (layer, bbox, size, format), written atomically and evicted
+    least-recently-used once the cache grows past `max_bytes`. The directory can be
+    shared by several worker processes; each keeps its own LRU index and picks up
+    tiles written by the others on lookup.
+    """
+    def __init__(self, directory: str = TILE_CACHE_DIR, max_bytes: int = TILE_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = os.path.normpath(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> size in bytes, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(layer: str, bbox: list, size: tuple, image_format: str) -> str:
+        raw = json.dumps([layer, [float(c) for c in bbox], [int(s) for s in size], image_format])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached tile bytes, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path) # Keeps the LRU order across restarts
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key not in self._entries:
+                # Written by another process sharing the directory
+                self._entries[key] = len(data)
+                self._size += len(data)
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Stores a tile. Written to a temporary file first so readers never see a partial tile."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.tile")
+
+    def _load_index(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tile"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len(".tile")], stat.st_size))
+            elif entry.name.endswith(".tmp") and time.time() - entry.stat().st_mtime > 3600:
+                # Left over from an interrupted write (recent ones may still be written by another process)
+                os.remove(entry.path)
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+# Shared by every download in this process
+tile_cache = TileCache()
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from dotenv import load_dotenv
+from owslib.wms import WebMapService
+from requests.adapters import HTTPAdapter
+
+# Load environment variables
+load_dotenv()
+
+WMS_TIMEOUT = int(os.getenv("WMS_TIMEOUT", "30")) # Seconds per WMS request
+WMS_CAPABILITIES_TTL = int(os.getenv("WMS_CAPABILITIES_TTL", "3600")) # Seconds before GetCapabilities is fetched again
+WMS_POOL_SIZE = int(os.getenv("WMS_POOL_SIZE", "8")) # Keep-alive connections kept open to the WMS host
+
+
+class WMSClient:
+    """
+    Process-wide WMS client.
+
+    The GetCapabilities document is fetched and parsed once and reused until it is older
+    than `capabilities_ttl`. GetMap requests go through a pooled requests session, so
+    connections to the WMS host are kept alive between tiles and analyses.
+    """
+    def __init__(self, url: str, version: str = '1.3.0', timeout: int = WMS_TIMEOUT,
+                 capabilities_ttl: int = WMS_CAPABILITIES_TTL, pool_size: int = WMS_POOL_SIZE):
+        self.url = url
+        self.version = version
+        self.timeout = timeout
+        self.capabilities_ttl = capabilities_ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._capabilities: Optional[WebMapService] = None
+        self._capabilities_loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.capabilities_refreshes = 0
+        self.last_refresh_seconds: Optional[float] = None
+        self.getmap_requests = 0
+
+    @property
+    def capabilities(self) -> WebMapService:
+        """The parsed capabilities document, refreshed once it is older than the TTL."""
+        with self._lock:
+            if self._capabilities is None or time.monotonic() - self._capabilities_loaded_at > self.capabilities_ttl:
+                start = time.perf_counter()
+                self._capabilities = WebMapService(self.url, version=self.version, timeout=self.timeout)
+                self._capabilities_loaded_at = time.monotonic()
+                self.capabilities_refreshes += 1
+                self.last_refresh_seconds = time.perf_counter() - start
+                print(f"Refreshed WMS capabilities in {self.last_refresh_seconds:.2f}s")
+            return self._capabilities
+
+    def getmap(self, layer: str, bbox: list, size: tuple, image_format: str = 'image/jpeg',
+               style: str = 'default', crs: str = 'EPSG:25832', transparent: bool = True) -> bytes:
+        """Requests a single GetMap image and returns the raw response body."""
+        if layer not in self.capabilities.contents:
+            raise ValueError(f"Layer {layer} is not offered by the WMS")
+
+        params = {
+            "SERVICE": "WMS",
+            "VERSION": self.version,
+            "REQUEST": "GetMap",
+            "LAYERS": layer,
+            "STYLES": style,
+            "CRS": crs,
+            "BBOX": ",".join(repr(float(c)) for c in bbox), # [minx, miny, maxx, maxy]; EPSG:25832 is easting/northing
+            "WIDTH": int(size[0]),
+            "HEIGHT": int(size[1]),
+            "FORMAT": image_format,
+            "TRANSPARENT": "TRUE" if transparent else "FALSE",
+        }
+        response = self.session.get(self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        with self._lock:
+            self.getmap_requests += 1
+
+        # WMS servers report errors as an XML ServiceException with a 200 status
+        if "xml" in response.headers.get("Content-Type", ""):
+            raise RuntimeError(f"WMS returned an exception for layer {layer}: {response.text[:500]}")
+        return response.content
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "capabilities_refreshes": self.capabilities_refreshes,
+                "last_refresh_seconds": self.last_refresh_seconds,
+                "capabilities_age_seconds": time.monotonic() - self._capabilities_loaded_at if self._capabilities else None,
+                "getmap_requests": self.getmap_requests,
+            }
+
+
+_wms_client: Optional[WMSClient] = None
+_wms_client_lock = threading.Lock()
+
+
+def get_wms_client() -> WMSClient:
+    """Returns the WMS client shared by every download in this process."""
+    global _wms_client
+    with _wms_client_lock:
+        if _wms_client is None:
+            # Build WMS URL from environment variables
+            WMS_BASE_URL = os.getenv("WMS_URL")
+            WMS_USERNAME = os.getenv("WMS_USERNAME")
+            WMS_PASSWORD = os.getenv("WMS_PASSWORD")
+            _wms_client = WMSClient(f'{WMS_BASE_URL}?username={WMS_USERNAME}&password={WMS_PASSWORD}')
+        return _wms_client
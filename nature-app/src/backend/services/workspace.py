@@ -0,0 +1,78 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Point at a tmpfs mount (e.g. /dev/shm/nature-app) to keep scratch files off the disk
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "workspaces"))
+WORKSPACE_STALE_AGE = int(os.getenv("WORKSPACE_STALE_AGE", "86400")) # Seconds before a leftover workspace is removed on startup
+
+
+class WorkspaceManager:
+    """
+    Hands out a private scratch directory per analysis.
+
+    Every directory gets a unique name, so concurrent analyses (in this or other worker
+    processes) never share files. Directories are reference counted: each `acquire`
+    of the same name shares the directory and it is deleted when the last holder
+    releases it.
+    """
+    def __init__(self, root: str = WORKSPACE_ROOT):
+        self.root = os.path.normpath(root)
+        self._workspaces = {} # name -> [path, reference count]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[str]:
+        """Yields the workspace directory for `name`, creating it for the first holder."""
+        path = self.retain(name)
+        try:
+            yield path
+        finally:
+            self.release(name)
+
+    def retain(self, name: str) -> str:
+        """Takes a reference on the workspace for `name` and returns its directory."""
+        with self._lock:
+            workspace = self._workspaces.get(name)
+            if workspace is None:
+                # The random suffix keeps names unique across worker processes and restarts
+                path = os.path.join(self.root, f"{name}_{os.getpid()}_{uuid.uuid4().hex[:8]}")
+                os.makedirs(path)
+                workspace = self._workspaces[name] = [path, 0]
+            workspace[1] += 1
+            return workspace[0]
+
+    def release(self, name: str):
+        """Drops a reference on the workspace for `name`, deleting the directory with the last one."""
+        with self._lock:
+            workspace = self._workspaces.get(name)
+            if workspace is None:
+                return
+            workspace[1] -= 1
+            if workspace[1] > 0:
+                return
+            del self._workspaces[name]
+        shutil.rmtree(workspace[0], ignore_errors=True)
+
+    def cleanup_stale(self, max_age: int = WORKSPACE_STALE_AGE):
+        """Removes workspaces left behind by crashed workers. Called once on app startup."""
+        if not os.path.isdir(self.root):
+            return
+        now = time.time()
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and now - entry.stat().st_mtime > max_age:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                print(f"Removed stale workspace: {entry.path}")
+
+
+# Shared by every analysis in this process
+workspace_manager = WorkspaceManager()
@@ -0,0 +1,117 @@
+"""
+Behaviour tests for the analysis job queue, with plain functions in place of the analysis.
+
+Run from src/backend:
+    python -m pytest tests
+"""
+import asyncio
+import os
+import threading
+
+import pytest
+from exceptions import AnalysisQueueFullException
+from fastapi import HTTPException
+from models import AnalysisJob
+from services.analysis_queue import AnalysisQueue
+
+CRASHING_RESULT_ID = 1
+
+
+def make_job(result_id: int) -> AnalysisJob:
+    return AnalysisJob(result_id=result_id, analysis_type="orthophoto", bbox=[0, 0, 1, 1], start_date="2020-01-01 00:00:00",
+                       end_date="2024-01-01 00:00:00", layers=[])
+
+
+def crash_or_report(job: AnalysisJob) -> dict:
+    # Module level so the process pool can pickle it
+    if job.result_id == CRASHING_RESULT_ID:
+        os._exit(1) # Dies like a worker killed for running out of memory
+    return {"result_id": job.result_id, "worker_stats": {"pid": os.getpid()}}
+
+
+class Recorder:
+    def __init__(self):
+        self.failures = {}
+
+    def __call__(self, job: AnalysisJob, error: Exception):
+        self.failures[job.result_id] = error
+
+
+def test_enqueue_rejects_jobs_when_full():
+    release = threading.Event()
+
+    async def run():
+        queue = AnalysisQueue(job_handler=lambda job: release.wait(5), failure_handler=Recorder(),
+                              workers=1, queue_depth=2, worker_mode="thread")
+        await queue.start()
+        await queue.enqueue(make_job(1))
+        await asyncio.sleep(0.1) # Job 1 is running, jobs 2 and 3 fill the queue
+        await queue.enqueue(make_job(2))
+        await queue.enqueue(make_job(3))
+        assert queue.is_full()
+        with pytest.raises(AnalysisQueueFullException):
+            await queue.enqueue(make_job(4))
+        release.set()
+        await queue._queue.join()
+        assert not queue.is_full()
+        await queue.stop()
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_reported_as_too_many_requests(monkeypatch):
+    # The controller imports the algorithm service, which needs torch, and the database engine, which needs a config
+    for name, value in {"DB_USER": "test", "DB_PASSWORD": "test", "DB_HOST": "localhost", "DB_PORT": "3306", "DB_NAME": "test"}.items():
+        monkeypatch.setenv(name, os.getenv(name) or value)
+    results_controller = pytest.importorskip("controllers.results_controller")
+
+    async def create_analysis(*args):
+        raise AnalysisQueueFullException()
+
+    monkeypatch.setattr(results_controller.algorithm_service, "create_analysis", create_analysis)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(results_controller.ResultsController().analyse_area(1, None, None))
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "30"
+
+
+def test_stop_fails_jobs_left_in_the_queue():
+    release = threading.Event()
+    failures = Recorder()
+
+    async def run():
+        queue = AnalysisQueue(job_handler=lambda job: release.wait(5), failure_handler=failures,
+                              workers=1, queue_depth=4, worker_mode="thread")
+        await queue.start()
+        for result_id in (1, 2, 3):
+            await queue.enqueue(make_job(result_id))
+        await asyncio.sleep(0.1) # Lets the consumer pick up job 1
+        await queue.stop()
+        release.set()
+        return queue
+
+    queue = asyncio.run(run())
+    assert sorted(failures.failures) == [2, 3]
+    assert all("shutdown" in str(error) for error in failures.failures.values())
+    assert queue.qsize() == 0
+
+
+def test_broken_process_pool_is_replaced():
+    failures = Recorder()
+
+    async def run():
+        queue = AnalysisQueue(job_handler=crash_or_report, failure_handler=failures,
+                              workers=1, queue_depth=4, worker_mode="process")
+        await queue.start()
+        for result_id in (CRASHING_RESULT_ID, 2, 3):
+            await queue.enqueue(make_job(result_id))
+        await asyncio.wait_for(queue._queue.join(), timeout=60)
+        stats = queue.stats()
+        await queue.stop()
+        return stats
+
+    stats = asyncio.run(run())
+    # The crashed job is failed, the jobs after it run on the replacement pool
+    assert list(failures.failures) == [CRASHING_RESULT_ID]
+    assert len(stats["worker_stats"]) == 1
+    assert stats["worker_stats"][0]["pid"] != os.getpid()
@@ -0,0 +1,111 @@
+"""
+CPU smoke tests for the encoder feature cache and the window encoder path, with a stub in place of SAM_CD.
+
+Run from src/backend:
+    python -m pytest tests
+"""
+import pytest
+
+torch = pytest.importorskip("torch")
+ortho_analysis = pytest.importorskip("algorithms.ortho_analysis")
+
+from torch.nn import functional as F  # noqa: E402
+
+from algorithms.models.SAM_CD import ENCODER_STRIDE, FEATURE_STRIDES, SAM_CD  # noqa: E402
+from algorithms.utils.crop_plan import CropPlan  # noqa: E402
+from services.feature_cache import FeatureCache  # noqa: E402
+
+CACHE_BYTES = 64 * 1024 * 1024
+
+
+class StubNet:
+    """Stands in for SAM_CD with a local (average pooling) encoder, so a crop's features are a slice of a larger encoding."""
+    imgsz = None
+    shared_pass = True
+    slice_features = staticmethod(SAM_CD.slice_features)
+
+    def __init__(self):
+        self.encoded = [] # Batch size of every encode call
+
+    def encode(self, x):
+        self.encoded.append(x.shape[0])
+        return [F.avg_pool2d(x, stride).repeat(1, 2, 1, 1) for stride in FEATURE_STRIDES]
+
+
+def make_analysis():
+    analysis = ortho_analysis.OrthoAnalysis.__new__(ortho_analysis.OrthoAnalysis) # Skips loading a checkpoint
+    analysis.net = StubNet()
+    analysis.device = torch.device("cpu")
+    analysis.encoder_version = "stub"
+    return analysis
+
+
+def make_views_and_keys(cache):
+    views = [torch.rand(1, 3, 64, 64), torch.rand(1, 3, 64, 64)]
+    keys = [cache.make_key(layer, [0, 0, 8, 8], (64, 64), (64, 64), "stub") for layer in ("a", "b")]
+    return views, keys
+
+
+def test_encode_views_miss_then_hit(tmp_path):
+    analysis = make_analysis()
+    cache = FeatureCache(memory_bytes=CACHE_BYTES, directory=str(tmp_path), disk_bytes=0)
+    views, keys = make_views_and_keys(cache)
+
+    first = analysis._encode_views(views, keys, cache)
+    assert analysis.net.encoded == [2] # Both missed and were encoded as one batch
+    second = analysis._encode_views(views, keys, cache)
+    assert analysis.net.encoded == [2] # Both hit
+    for feats_first, feats_second in zip(first, second):
+        for first_feat, second_feat in zip(feats_first, feats_second):
+            assert second_feat.dtype == torch.float32
+            assert torch.equal(first_feat, second_feat)
+
+
+def test_encode_views_only_encodes_misses(tmp_path):
+    analysis = make_analysis()
+    cache = FeatureCache(memory_bytes=CACHE_BYTES, directory=str(tmp_path), disk_bytes=0)
+    views, keys = make_views_and_keys(cache)
+
+    analysis._encode_views(views[:1], keys[:1], cache)
+    analysis._encode_views(views, keys, cache)
+    assert analysis.net.encoded == [1, 1]
+
+
+def test_only_persisted_features_reach_the_disk(tmp_path):
+    analysis = make_analysis()
+    cache = FeatureCache(memory_bytes=CACHE_BYTES, directory=str(tmp_path), disk_bytes=CACHE_BYTES)
+    views, keys = make_views_and_keys(cache)
+
+    analysis._encode_views(views, keys, cache, persist=[True, False])
+    fresh = FeatureCache(memory_bytes=CACHE_BYTES, directory=str(tmp_path), disk_bytes=CACHE_BYTES)
+    assert fresh.get(keys[0]) is not None
+    assert fresh.get(keys[1]) is None
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    feats = [torch.zeros(1, 4, 16, 16)] # 2KB as float16
+    cache = FeatureCache(memory_bytes=5000, directory=str(tmp_path), disk_bytes=0)
+    cache.put("a", feats)
+    cache.put("b", feats)
+    cache.get("a")
+    cache.put("c", feats)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_key_depends_on_padded_shape():
+    small = FeatureCache.make_key("layer", [0, 0, 1, 1], (500, 500), (512, 512), "v")
+    large = FeatureCache.make_key("layer", [0, 0, 1, 1], (500, 500), (1024, 1024), "v")
+    assert small != large
+
+
+def test_sliced_window_features_match_crop_encoding():
+    net = StubNet()
+    window = torch.rand(1, 3, 128, 192)
+    feats = net.encode(window)
+    plan = CropPlan(128, 192, (64, 64), pad=True, align=ENCODER_STRIDE)
+    for row, col in plan:
+        crop = window[..., row:row + 64, col:col + 64]
+        for sliced, direct in zip(net.slice_features(feats, row, col, 64, 64), net.encode(crop)):
+            assert torch.allclose(sliced, direct)
@@ -0,0 +1,45 @@
+"""
+Round trip tests for the COCO RLE encoding of stored change masks.
+
+Run from src/backend:
+    python -m pytest tests
+"""
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+# Loaded from its file, since importing the algorithms.utils package pulls in torch
+_spec = importlib.util.spec_from_file_location(
+    "mask_utils", os.path.join(os.path.dirname(__file__), "..", "algorithms", "utils", "utils.py"))
+mask_utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(mask_utils)
+
+
+@pytest.mark.parametrize("mask", [
+    np.zeros((4, 5), dtype=np.uint8),
+    np.ones((4, 5), dtype=np.uint8),
+    np.eye(6, 3, dtype=np.uint8),
+    (np.random.default_rng(0).random((37, 53)) > 0.7).astype(np.uint8),
+])
+def test_round_trip(mask):
+    rle = mask_utils.mask_to_coco_rle(mask)
+    assert rle["size"] == list(mask.shape)
+    assert sum(rle["counts"]) == mask.size
+    decoded = mask_utils.coco_rle_to_mask(rle)
+    assert decoded.dtype == np.uint8
+    assert np.array_equal(decoded, mask)
+
+
+def test_counts_are_column_major_and_start_with_background():
+    mask = np.array([[1, 0],
+                     [1, 1]], dtype=np.uint8)
+    # Column-major pixels are 1, 1, 0, 1; the leading 0 is the empty background run
+    assert mask_utils.mask_to_coco_rle(mask)["counts"] == [0, 2, 1, 1]
+
+
+def test_any_positive_value_is_foreground():
+    mask = np.array([[0, 255], [3, 0]], dtype=np.uint8)
+    decoded = mask_utils.coco_rle_to_mask(mask_utils.mask_to_coco_rle(mask))
+    assert np.array_equal(decoded, (mask > 0).astype(np.uint8))
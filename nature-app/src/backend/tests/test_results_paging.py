@@ -0,0 +1,64 @@
+"""
+Tests for the results listing, against an in-memory SQLite database.
+
+Run from src/backend:
+    python -m pytest tests
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from database.results import ResultsAccess
+from models import Results
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+db_results = ResultsAccess()
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        now = datetime.now(timezone.utc)
+        for result_id in range(1, 8):
+            session.add(Results(result_id=result_id, user_id=1 if result_id != 4 else 2, location_id=1,
+                                analysis_date=now, analysis_type="orthophoto", request_parameters={},
+                                requested_at=now, status="Complete", result={"mask": "large"},
+                                summary={"polygon_count": result_id, "changed_area": 1.5, "bbox": [0, 0, 1, 1]}))
+        session.add(Results(result_id=8, user_id=1, location_id=1, analysis_date=now, analysis_type="orthophoto",
+                            request_parameters={}, requested_at=now))
+        session.commit()
+        yield session
+
+
+def list_ids(session, **kwargs) -> list[int]:
+    return [summary.result_id for summary in asyncio.run(db_results.get_results(session, user_id=1, **kwargs))]
+
+
+def test_pages_newest_first_with_before_id(session):
+    first = list_ids(session, limit=3)
+    second = list_ids(session, limit=3, before_id=first[-1])
+    third = list_ids(session, limit=3, before_id=second[-1])
+    assert first == [8, 7, 6]
+    assert second == [5, 3, 2] # Result 4 belongs to another user
+    assert third == [1]
+    assert list_ids(session, limit=3, before_id=third[-1]) == []
+
+
+def test_offset_pages_use_the_same_order(session):
+    assert list_ids(session, limit=3, offset=3) == [5, 3, 2]
+
+
+def test_before_id_takes_precedence_over_offset(session):
+    assert list_ids(session, limit=2, offset=5, before_id=6) == [5, 3]
+
+
+def test_summaries_come_from_the_summary_column(session):
+    summaries = asyncio.run(db_results.get_results(session, user_id=1, limit=2))
+    running, complete = summaries
+    assert running.status == "RUNNING"
+    assert (running.polygon_count, running.changed_area, running.bbox) == (0, 0.0, None)
+    assert (complete.polygon_count, complete.changed_area, complete.bbox) == (7, 1.5, [0, 0, 1, 1])
+    assert not hasattr(complete, "result")
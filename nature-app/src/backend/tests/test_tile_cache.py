@@ -0,0 +1,88 @@
+"""
+Behaviour tests for the on-disk WMS tile cache.
+
+Run from src/backend:
+    python -m pytest tests
+"""
+import os
+import time
+
+import pytest
+from services import tile_cache as tile_cache_module
+from services.tile_cache import TileCache
+
+
+def tile_files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".tile"))
+
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = TileCache(str(tmp_path), max_bytes=1024)
+    key = cache.make_key("layer", [0, 0, 64, 64], (512, 512), "image/jpeg")
+    assert cache.get(key) is None
+    cache.put(key, b"tile")
+    assert cache.get(key) == b"tile"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = TileCache(str(tmp_path), max_bytes=250)
+    cache.put("a", b"x" * 100)
+    cache.put("b", b"x" * 100)
+    cache.get("a") # b is now the least recently used
+    cache.put("c", b"x" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert tile_files(tmp_path) == ["a.tile", "c.tile"]
+    assert cache.stats()["size_bytes"] == 200
+    assert cache.stats()["evictions"] == 1
+
+
+def test_index_is_rebuilt_in_lru_order(tmp_path):
+    cache = TileCache(str(tmp_path), max_bytes=1024)
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100)
+    now = time.time()
+    for age, key in ((30, "a"), (10, "b"), (20, "c")):
+        os.utime(os.path.join(tmp_path, f"{key}.tile"), (now - age, now - age))
+
+    restarted = TileCache(str(tmp_path), max_bytes=250) # Smaller limit, so the oldest entry goes on load
+    assert tile_files(tmp_path) == ["b.tile", "c.tile"]
+    assert restarted.stats()["entries"] == 2
+
+
+def test_sees_tiles_written_by_another_process(tmp_path):
+    first = TileCache(str(tmp_path), max_bytes=1024)
+    second = TileCache(str(tmp_path), max_bytes=1024)
+    first.put("a", b"tile")
+    assert second.get("a") == b"tile"
+    assert second.stats()["entries"] == 1
+
+
+def test_failed_write_keeps_the_previous_tile(tmp_path, monkeypatch):
+    cache = TileCache(str(tmp_path), max_bytes=1024)
+    cache.put("a", b"old")
+
+    def interrupted_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tile_cache_module.os, "replace", interrupted_replace)
+    with pytest.raises(OSError):
+        cache.put("a", b"new")
+    monkeypatch.undo()
+
+    assert cache.get("a") == b"old"
+    assert os.listdir(tmp_path) == ["a.tile"] # No temporary file left behind
+
+
+def test_stale_temporary_files_are_removed_on_load(tmp_path):
+    stale, fresh = tmp_path / "stale.tmp", tmp_path / "fresh.tmp"
+    stale.write_bytes(b"partial")
+    fresh.write_bytes(b"partial")
+    old = time.time() - 2 * 3600
+    os.utime(stale, (old, old))
+
+    cache = TileCache(str(tmp_path), max_bytes=1024)
+    assert not stale.exists()
+    assert fresh.exists() # May still be written by another process
+    assert cache.stats()["entries"] == 0
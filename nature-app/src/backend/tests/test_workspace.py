@@ -0,0 +1,88 @@
+"""
+Behaviour tests for the per-analysis scratch workspaces.
+
+Run from src/backend:
+    python -m pytest tests
+"""
+import os
+import threading
+import time
+
+import pytest
+from services.workspace import WorkspaceManager
+
+
+def test_acquire_creates_and_removes_the_directory(tmp_path):
+    manager = WorkspaceManager(str(tmp_path))
+    with manager.acquire("analysis_1") as path:
+        assert os.path.isdir(path)
+        assert os.path.dirname(path) == os.path.normpath(str(tmp_path))
+    assert not os.path.exists(path)
+
+
+def test_nested_acquires_share_the_directory_until_the_last_release(tmp_path):
+    manager = WorkspaceManager(str(tmp_path))
+    with manager.acquire("analysis_1") as outer:
+        with manager.acquire("analysis_1") as inner:
+            assert inner == outer
+        assert os.path.isdir(outer) # Still held by the outer acquire
+    assert not os.path.exists(outer)
+
+
+def test_retain_and_release_count_references(tmp_path):
+    manager = WorkspaceManager(str(tmp_path))
+    path = manager.retain("analysis_1")
+    assert manager.retain("analysis_1") == path
+    manager.release("analysis_1")
+    assert os.path.isdir(path)
+    manager.release("analysis_1")
+    assert not os.path.exists(path)
+    manager.release("analysis_1") # Releasing an unknown workspace is a no-op
+
+
+def test_names_get_separate_unique_directories(tmp_path):
+    manager, other_process = WorkspaceManager(str(tmp_path)), WorkspaceManager(str(tmp_path))
+    with manager.acquire("analysis_1") as first, manager.acquire("analysis_2") as second, \
+            other_process.acquire("analysis_1") as third:
+        assert len({first, second, third}) == 3
+        open(os.path.join(first, "image.png"), "wb").close()
+        assert os.listdir(third) == []
+
+
+def test_workspace_is_removed_when_the_holder_raises(tmp_path):
+    manager = WorkspaceManager(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with manager.acquire("analysis_1") as path:
+            raise RuntimeError("analysis failed")
+    assert not os.path.exists(path)
+
+
+def test_concurrent_holders_share_one_directory(tmp_path):
+    manager = WorkspaceManager(str(tmp_path))
+    paths, barrier = [], threading.Barrier(8)
+
+    def hold():
+        with manager.acquire("analysis_1") as path:
+            paths.append(path)
+            barrier.wait(5) # Every thread holds the workspace at the same time
+
+    threads = [threading.Thread(target=hold) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(paths)) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_cleanup_stale_only_removes_old_workspaces(tmp_path):
+    manager = WorkspaceManager(str(tmp_path))
+    stale, fresh = tmp_path / "analysis_1_old", tmp_path / "analysis_2_new"
+    stale.mkdir()
+    fresh.mkdir()
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+
+    manager.cleanup_stale(max_age=3600)
+    assert not stale.exists()
+    assert fresh.exists()